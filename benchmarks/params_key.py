@@ -0,0 +1,101 @@
+"""
+Microbenchmark of cache key computation.
+
+Measures the cost of computing the cache key of recording parameters the way
+a batch import does (three key() calls per recording: exists, store and
+a report) in three variants:
+
+- uncached: the key is normalized on every call,
+- key cache: the key is computed once per parameters object, without the
+  memo of normalized strings,
+- key cache + memo: as above, with the memo, which is cleared before each
+  repetition, so that it helps only with repeated parameters.
+
+Each variant runs on two workloads: one which repeats a few hundred distinct
+recordings (as when the same albums are imported over and over), and one in
+which every recording is unique (as in a typical import, where the memo
+rarely hits). Run from the repository root:
+
+    python benchmarks/params_key.py [-n NUMBER]
+"""
+
+import argparse
+import timeit
+from typing import Callable, List, Tuple
+
+from mbnames import normalize
+
+from mbcache import params
+from mbcache.params import _RecordingParams
+
+LOOKUPS = 10000
+
+ARTISTS = [f'Artist Number {i}' for i in range(50)]
+ALBUMS = [f'Album Title {i} (Deluxe Edition)' for i in range(20)]
+TITLES = [f'Track Title {i} (feat. Someone Else)' for i in range(200)]
+
+_Workload = List[Tuple[str, str, str]]
+
+
+def _repeated() -> _Workload:
+    """200 distinct recordings, each looked up 50 times."""
+    return [(ARTISTS[i % len(ARTISTS)], TITLES[i % len(TITLES)], ALBUMS[i % len(ALBUMS)])
+            for i in range(LOOKUPS)]
+
+
+def _unique() -> _Workload:
+    """Every recording looked up once."""
+    return [(f'Artist Number {i}', f'Track Title {i} (feat. Someone Else)',
+             f'Album Title {i} (Deluxe Edition)') for i in range(LOOKUPS)]
+
+
+def _uncached(workload: _Workload) -> None:
+    for artist, title, album in workload:
+        for _ in range(3):
+            normalize('\t'.join((artist, album, title)))
+
+
+def _key_cached(workload: _Workload) -> None:
+    for artist, title, album in workload:
+        recording = _RecordingParams(artist, title, album)
+        for _ in range(3):
+            recording.key()
+
+
+def _measure(function: Callable[[_Workload], None], workload: _Workload, memo: bool,
+             number: int) -> float:
+    memoized = params._normalize  # pylint: disable=protected-access
+    params._normalize = memoized if memo else normalize  # pylint: disable=protected-access
+
+    try:
+        seconds = min(
+            timeit.repeat(lambda: function(workload),
+                          setup=memoized.cache_clear,
+                          number=1,
+                          repeat=number))
+    finally:
+        params._normalize = memoized  # pylint: disable=protected-access
+
+    return seconds / len(workload) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark cache key computation.')
+    parser.add_argument('-n', '--number', type=int, default=10, help='number of repetitions')
+    args = parser.parse_args()
+
+    variants = (
+        ('uncached', _uncached, False),
+        ('key cache', _key_cached, False),
+        ('key cache + memo', _key_cached, True),
+    )
+
+    print(f'{"us per lookup":>16}  {"repeated":>9}  {"unique":>9}')
+    for name, function, memo in variants:
+        repeated = _measure(function, _repeated(), memo, args.number)
+        unique = _measure(function, _unique(), memo, args.number)
+        print(f'{name:>16}  {repeated:9.2f}  {unique:9.2f}')
+
+
+if __name__ == '__main__':
+    main()
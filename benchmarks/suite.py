@@ -0,0 +1,315 @@
+"""
+Benchmark suite of the recording and release caches.
+
+For each requested size, synthetic recording and release caches with that
+many entries are generated in a temporary XDG cache directory, and the
+following are measured:
+
+- open time of both caches,
+- lookup, exists and store throughput of the recordings cache,
+- lookup_id latency of the releases cache,
+- time of the index flush done when a modified cache is deleted,
+- remove_orphans() time of the releases cache,
+- mb-copy-recordings bulk mode throughput.
+
+MusicBrainz is replaced by a deterministic local stand-in (see mbfake.py).
+Results are written as JSON, and can be compared with the results of an
+earlier run. Run from the repository root, with the mbcache dependencies
+(other than musicbrainzngs) installed:
+
+    python benchmarks/suite.py --sizes 1000,100000 --output new.json --baseline old.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+import mbfake
+
+# metrics whose higher values are better; all others are durations
+_THROUGHPUTS = {'lookup_per_s', 'exists_per_s', 'store_per_s', 'copy_recordings_per_s'}
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the recording and release caches.')
+
+    parser.add_argument('-s',
+                        '--sizes',
+                        default='1000,10000,100000',
+                        help='comma-separated cache sizes, in entries (default: %(default)s)')
+
+    parser.add_argument('-b',
+                        '--backend',
+                        default='json',
+                        help='index backend of the caches (default: %(default)s)')
+
+    parser.add_argument('-S',
+                        '--storage',
+                        choices=['files', 'pack'],
+                        default='files',
+                        help='storage engine of the releases cache (default: %(default)s)')
+
+    parser.add_argument('-n',
+                        '--operations',
+                        type=int,
+                        default=1000,
+                        help='number of operations per throughput measurement '
+                        '(default: %(default)s)')
+
+    parser.add_argument('-o', '--output', default=None, help='write results to this JSON file')
+
+    parser.add_argument('-B',
+                        '--baseline',
+                        default=None,
+                        help='compare results with this JSON file written by an earlier run')
+
+    parser.add_argument('-t',
+                        '--threshold',
+                        type=float,
+                        default=0.1,
+                        help='relative change reported as a regression (default: %(default)s)')
+
+    parser.add_argument('--seed', type=int, default=0, help='random seed (default: %(default)s)')
+
+    return parser.parse_args()
+
+
+@contextlib.contextmanager
+def _quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def _timed(function: Callable) -> float:
+    start = time.perf_counter()
+    with _quiet():
+        function()
+    return time.perf_counter() - start
+
+
+def _recording(number: int) -> Tuple[str, str, str]:
+    return f'Artist {number % 997}', f'Title {number}', f'Album {number % 7919}'
+
+
+def _release_mbid(number: int) -> str:
+    return f'{number:08x}-0000-4000-8000-000000000000'
+
+
+class _Suite:
+    """Benchmarks of caches of one size."""
+
+    # pylint: disable=import-outside-toplevel
+    def __init__(self, args, size: int):
+        from mbcache.cache import _RecordingCache, _ReleaseCache
+        from mbcache.params import _RecordingParams, _ReleaseParams
+
+        self.args = args
+        self.size = size
+        self.random = random.Random(args.seed)
+        self.recording_cache = _RecordingCache
+        self.release_cache = _ReleaseCache
+        self.recording_params = _RecordingParams
+        self.release_params = _ReleaseParams
+        self.results: Dict[str, float] = {}
+
+    def _open_recordings(self):
+        return self.recording_cache('mbcache', 'recordings', backend=self.args.backend)
+
+    def _open_releases(self):
+        return self.release_cache('mbcache',
+                                  'releases',
+                                  backend=self.args.backend,
+                                  storage=self.args.storage)
+
+    def generate(self) -> None:
+        """Create synthetic caches of the suite's size."""
+        with _quiet():
+            recordings = self._open_recordings()
+            for number in range(self.size):
+                recordings.store(f'{number:08x}-1111-4111-8111-111111111111',
+                                 self.recording_params(*_recording(number)))
+            recordings.close()
+
+            releases = self._open_releases()
+            for number in range(self.size):
+                mbid = _release_mbid(number)
+                release = mbfake.make_release(mbid)
+                params = self.release_params(release['artist-credit-phrase'], release['title'],
+                                             None)
+                releases.store(release, params)
+            releases.close()
+
+    def _sample(self) -> List[int]:
+        return [self.random.randrange(self.size) for _ in range(self.args.operations)]
+
+    def measure_open(self) -> None:
+        """Open time of both caches."""
+        openers = (('recordings', self._open_recordings), ('releases', self._open_releases))
+        for name, opener in openers:
+            caches = []
+            self.results[f'open_{name}_s'] = _timed(lambda opener=opener: caches.append(opener()))
+            with _quiet():
+                caches[0].close()
+
+    def measure_recordings(self) -> None:
+        """Lookup, exists and store throughput, and flush time on deletion."""
+        with _quiet():
+            cache = self._open_recordings()
+
+        params = [self.recording_params(*_recording(number)) for number in self._sample()]
+        operations = len(params)
+
+        elapsed = _timed(lambda: [cache.lookup(p) for p in params])
+        self.results['lookup_per_s'] = operations / elapsed
+
+        params = [self.recording_params(*_recording(number)) for number in self._sample()]
+        elapsed = _timed(lambda: [cache.exists(p) for p in params])
+        self.results['exists_per_s'] = operations / elapsed
+
+        new = [
+            self.recording_params(*_recording(self.size + number)) for number in range(operations)
+        ]
+        elapsed = _timed(
+            lambda: [cache.store('ffffffff-1111-4111-8111-111111111111', p) for p in new])
+        self.results['store_per_s'] = operations / elapsed
+
+        # the modified index is written by the destructor, when the last reference is dropped
+        caches = [cache]
+        del cache
+        self.results['flush_on_del_s'] = _timed(caches.clear)
+
+    def measure_releases(self) -> None:
+        """Latency of lookup_id, and time of remove_orphans()."""
+        with _quiet():
+            cache = self._open_releases()
+
+        latencies = []
+        for number in self._sample():
+            mbid = _release_mbid(number)
+            start = time.perf_counter()
+            cache.lookup_id(mbid)
+            latencies.append(time.perf_counter() - start)
+
+        latencies.sort()
+        self.results['lookup_id_mean_s'] = statistics.fmean(latencies)
+        self.results['lookup_id_p50_s'] = latencies[len(latencies) // 2]
+        self.results['lookup_id_p99_s'] = latencies[int(len(latencies) * 0.99)]
+
+        self.results['remove_orphans_s'] = _timed(cache.remove_orphans)
+
+        with _quiet():
+            cache.close()
+
+    def measure_copy_recordings(self, workdir: str) -> None:
+        """
+        Throughput of mb-copy-recordings in bulk mode, in recordings per
+        second.
+        """
+        # pylint: disable=import-outside-toplevel
+        from mbcache import copy_recordings
+
+        count = min(self.size, max(1, self.args.operations // mbfake.TRACKS_PER_RELEASE))
+        input_path = os.path.join(workdir, 'releases.txt')
+        with open(input_path, 'w', encoding='utf-8') as input_file:
+            for number in self.random.sample(range(self.size), count):
+                input_file.write(_release_mbid(number) + '\n')
+
+        args = argparse.Namespace(input=input_path,
+                                  backend=self.args.backend,
+                                  selection='score',
+                                  review_queue=None,
+                                  workers=4,
+                                  dry_run=False,
+                                  feat_string=None,
+                                  disambiguation=None)
+        # pylint: disable=protected-access
+        elapsed = _timed(lambda: copy_recordings._copy_releases(args))
+        self.results['copy_recordings_per_s'] = count * mbfake.TRACKS_PER_RELEASE / elapsed
+
+    def run(self, workdir: str) -> Dict[str, float]:
+        """Run all benchmarks and return their results."""
+        self.generate()
+        self.measure_open()
+        self.measure_recordings()
+        self.measure_releases()
+        self.measure_copy_recordings(workdir)
+        return self.results
+
+
+def _compare(results: Dict, baseline: Dict, threshold: float) -> int:
+    """Print changes against the baseline and return the number of regressions."""
+    regressions = 0
+
+    for size, metrics in results['results'].items():
+        previous = baseline['results'].get(size, {})
+        for name, value in metrics.items():
+            if name not in previous or previous[name] == 0:
+                continue
+
+            change = value / previous[name] - 1
+            worse = -change if name in _THROUGHPUTS else change
+            mark = ''
+            if worse > threshold:
+                mark = '  REGRESSION'
+                regressions += 1
+
+            print(f'{size:>8} {name:<24} {previous[name]:>12.6g} -> {value:>12.6g} '
+                  f'({change:+.1%}){mark}')
+
+    return regressions
+
+
+def main():
+    args = _parse_args()
+    sizes = [int(size) for size in args.sizes.split(',')]
+
+    workdir = tempfile.mkdtemp(prefix='mbcache-bench-')
+    # must be set before the xdg module is imported by mbcache
+    os.environ['XDG_CACHE_HOME'] = workdir
+    mbfake.install()
+
+    results: Dict = {
+        'meta': {
+            'time': int(time.time()),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'backend': args.backend,
+            'storage': args.storage,
+            'operations': args.operations,
+            'seed': args.seed,
+        },
+        'results': {},
+    }
+
+    try:
+        for size in sizes:
+            print(f'Benchmarking caches of {size} entries...', file=sys.stderr)
+            results['results'][str(size)] = _Suite(args, size).run(workdir)
+            shutil.rmtree(os.path.join(workdir, 'mbcache'), ignore_errors=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(json.dumps(results, indent=1))
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump(results, output, indent=1)
+
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as baseline:
+            if _compare(results, json.load(baseline), args.threshold) > 0:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
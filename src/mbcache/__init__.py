@@ -1,3 +1,5 @@
 """Caches for MusicBrainz entities."""
 
 from mbcache.interface import MbRecordingCache, MbReleaseCache
+from mbcache.selection import (DEFERRED, DeferredSelection, InteractiveSelection, ScoreSelection,
+                               SelectionPolicy)
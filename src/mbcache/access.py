@@ -0,0 +1,152 @@
+"""
+Access times of cache entries.
+
+Recording the time of every lookup in the cache index would modify the index
+on every cache hit, so that even a session which only reads from the cache
+would have to write the index when it is closed. Instead, lookup times are
+appended to a separate log file, which is never rewritten on a cache hit.
+
+Times are recorded with coarse granularity: a lookup is logged only if the
+cache has not logged a lookup of the entry within the granularity (one hour
+by default) since it was opened. Logging a lookup therefore only appends to
+the log, without reading it, and a session logs at most one line per entry
+and hour. The log is read only when access times are needed, for eviction
+or compaction. When the log grows much larger than the number of cache
+entries, it is compacted on close, keeping only the last line of each key.
+"""
+
+import json
+import os
+from typing import Callable, Dict, Optional, TextIO
+
+
+class _AccessLog:
+    """
+    Append-only log of the last access times of cache entries.
+
+    Each line of the log is a JSON array holding the key and the time of an
+    access, as a UNIX timestamp. The last line for a key wins. The log is
+    read only when access times are first needed.
+    """
+
+    min_compact = 1000
+
+    def __init__(self, cache_dir: str, name: str = 'access', granularity: int = 3600):
+        self.path = os.path.join(cache_dir, name + '.log')
+        self.granularity = granularity
+        self.times: Optional[Dict[str, int]] = None
+        # number of lines in the log, known once it has been read
+        self.records = 0
+        # accesses logged by this object, and the number and size of their lines
+        self.logged: Dict[str, int] = {}
+        self.appended = 0
+        self.written = 0
+        self.log: Optional[TextIO] = None
+
+    def _load(self) -> Dict[str, int]:
+        if self.times is not None:
+            return self.times
+
+        self.flush()
+        times: Dict[str, int] = {}
+        self.records = 0
+
+        try:
+            with open(self.path, encoding='utf-8') as log:
+                for line in log:
+                    try:
+                        key, accessed = json.loads(line)
+                    except ValueError:
+                        # a line truncated by an interrupted write
+                        continue
+                    times[key] = accessed
+                    self.records += 1
+        except FileNotFoundError:
+            pass
+
+        self.times = times
+        return times
+
+    def get(self, key: str) -> Optional[int]:
+        """Return the time of the last logged access to the key, if any."""
+        return self._load().get(key)
+
+    def touch(self, key: str, now: int) -> None:
+        """
+        Log an access to the key at the given time, unless this object logged
+        one recently. The log is not read.
+        """
+        last = self.logged.get(key)
+        if last is not None and now - last < self.granularity:
+            return
+
+        if self.log is None:
+            # pylint: disable=consider-using-with
+            self.log = open(self.path, 'a', encoding='utf-8')
+
+        line = json.dumps([key, now], separators=(',', ':')) + '\n'
+        self.log.write(line)
+        self.logged[key] = now
+        self.appended += 1
+        self.written += len(line)
+
+        if self.times is not None:
+            self.times[key] = now
+            self.records += 1
+
+    def _estimate_records(self) -> int:
+        """Estimate the number of lines in the log from its size, without reading it."""
+        if self.appended == 0:
+            return 0
+
+        self.flush()
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+        return size * self.appended // self.written
+
+    def compact(self, live: Callable[[str], bool], entries: Callable[[], int]) -> None:
+        """
+        Rewrite the log with one line per key for which live(key) is true, if
+        the log holds many more lines than there are cache entries (as
+        returned by entries()). Unless the log has already been read, it is
+        read only if this object has logged something, and the size of the
+        log suggests that it needs compaction.
+        """
+        records = self.records if self.times is not None else self._estimate_records()
+        if records <= self.min_compact:
+            return
+
+        threshold = max(self.min_compact, 2 * entries())
+        if records <= threshold:
+            return
+
+        times = self._load()
+        if self.records <= threshold:
+            return
+
+        self.close()
+        self.times = {key: accessed for key, accessed in times.items() if live(key)}
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as log:
+            for key, accessed in self.times.items():
+                log.write(json.dumps([key, accessed], separators=(',', ':')) + '\n')
+        os.replace(temp_path, self.path)
+
+        self.records = len(self.times)
+        self.appended = 0
+        self.written = 0
+
+    def flush(self) -> None:
+        """Write buffered log lines to disk."""
+        if self.log is not None:
+            self.log.flush()
+
+    def close(self) -> None:
+        """Close the log file. The log can still be used afterwards."""
+        if self.log is not None:
+            self.log.close()
+            self.log = None
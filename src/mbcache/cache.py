@@ -1,77 +1,440 @@
 """A simple cache for storing MusicBrainz recordings and releases."""
 
-import glob
+import functools
 import json
 import os
+import threading
 import time
-from typing import Dict, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, TypeVar, Union, cast
 
 from xdg import BaseDirectory
 
-from mbcache.lock import _Lock
+from mbcache.access import _AccessLog
+from mbcache.fuzzy import _TrigramIndex
+from mbcache.index import _Index, _open_index, _resolve_backend
+from mbcache.lock import _Lock, _RwLock
+from mbcache.lru import _LruCache
+from mbcache.metrics import _Metrics
 from mbcache.params import _EntityParams
+from mbcache.release_store import (_FileReleaseStore, _PackReleaseStore, _ReleaseStore,
+                                   _resolve_storage)
+from mbcache.tracklist import _make_tracklist
 
 _EntityData = Union[str, Dict]
+_Method = TypeVar('_Method', bound=Callable[..., Any])
+
+
+def _reading(method: _Method) -> _Method:
+    """Run the cache method while holding the cache lock for reading."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.rwlock.read():
+            return method(self, *args, **kwargs)
+
+    return cast(_Method, wrapper)
+
+
+def _writing(method: _Method) -> _Method:
+    """Run the cache method while holding the cache lock for writing."""
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.rwlock.write():
+            return method(self, *args, **kwargs)
+
+    return cast(_Method, wrapper)
 
 
 class _Cache:
-    """Base class for entity-specific MusicBrainz caches."""
+    """
+    Base class for entity-specific MusicBrainz caches.
+
+    By default the cache holds an exclusive lock for its whole lifetime. If
+    read_only is True, a shared lock is taken instead, so that many read-only
+    caches can be open at the same time. Lookups in a read-only cache do not
+    record lookup times. The lock is upgraded to an exclusive one (and the
+    index is reloaded) only when something is written to the cache.
+
+    The index backend is recorded in the cache directory. If backend is None,
+    the recorded backend is used; a different one is accepted only to migrate
+    a JSON index (see mbcache.index), otherwise ValueError is raised.
+
+    If negative_ttl is set, the cache also records failed searches and
+    lookups, so that they are not repeated for negative_ttl seconds. Negative
+    entries are kept in a separate index, and are not reported by exists().
+
+    If max_entries or max_bytes is set, the cache is shrunk to these limits
+    when it is closed after something was stored in it, by evicting entries
+    as described in evict().
 
-    def __init__(self, application: str, cache_name: str):
-        self.cache: Optional[dict] = None
-        self.update_required = False
+    Lookup times are not stored in the index, so that cache hits do not
+    modify it. They are appended to an access log (see mbcache.access) with
+    one hour granularity instead.
+
+    Hits, misses and timings of index and storage operations are recorded in
+    metrics (see mbcache.metrics), which can be shared with other objects.
+
+    A cache object can be shared by many threads. Lookups run in parallel,
+    while methods which modify the cache run one at a time, and exclude
+    lookups. Lookup times are recorded under a separate mutex.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 application: str,
+                 cache_name: str,
+                 backend: Optional[str] = None,
+                 read_only: bool = False,
+                 negative_ttl: Optional[int] = None,
+                 max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None,
+                 metrics: Optional[_Metrics] = None):
+        self.index: Optional[_Index] = None
+        self.negative: Optional[_Index] = None
+        self.fuzzy: Optional[_TrigramIndex] = None
+        self.rwlock = _RwLock()
+        self.mutex = threading.Lock()
+        self.backend = 'json'
+        self.read_only = read_only
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.stored = False
+        self.metrics = metrics if metrics is not None else _Metrics()
         self.cache_dir = BaseDirectory.save_cache_path(application, cache_name)
-        self.index_path = os.path.join(self.cache_dir, 'index.json')
         self.lock = _Lock(os.path.join(self.cache_dir, f'.{cache_name}.lock'))
+        self.access = _AccessLog(self.cache_dir)
 
-        self.lock.acquire()
+        self.lock.acquire(shared=read_only)
 
         try:
-            with open(self.index_path, encoding='utf-8') as cache_index:
-                self.cache = json.load(cache_index)
-            print('Loaded', len(self.cache), 'cache entries.')
-        except FileNotFoundError:
-            self.cache = {}
+            self.backend = _resolve_backend(self.cache_dir, backend, read_only)
+        except ValueError:
+            self.close()
+            raise
+
+        self._open_indexes(read_only)
+        assert self.index is not None, 'index is None'
+        if self.index.created:
             print('Cache index does not exist. Initialized empty cache.')
+        else:
+            print('Loaded', len(self.index), 'cache entries.')
 
     def __del__(self):
-        if self.cache is not None:
-            if self.update_required:
-                with open(self.index_path, 'w', encoding='utf-8') as cache_index:
-                    json.dump(self.cache, cache_index, indent=1, sort_keys=True)
+        self.close()
+
+    @_reading
+    def __repr__(self):
+        assert self.index is not None, 'index is None'
+        return json.dumps(dict(self.index.items()), indent=1)
+
+    @_writing
+    def close(self) -> None:
+        """
+        Write pending changes to disk and release the cache lock. The cache
+        cannot be used after it has been closed.
+        """
+        if self.index is not None:
+            if self.lock.exclusive:
+                self._enforce_limits()
+                # clean up only after the index no longer refers to removed data
+                with self.metrics.timer('index.flush'):
+                    self._flush_storage()
+                    self.index.flush()
+                self._cleanup()
+                self.access.compact(self.index.__contains__, self.index.__len__)
+
+            self.access.close()
+            self.index.close()
+            self.index = None
+            self._close_storage()
+
+        if self.negative is not None:
+            self.negative.close()
+            self.negative = None
 
         self.lock.release()
 
-    def __repr__(self):
-        return json.dumps(self.cache, indent=1)
+    def _open_indexes(self, read_only: bool) -> None:
+        with self.metrics.timer('index.load'):
+            self.index = _open_index(self.backend, self.cache_dir, read_only=read_only)
+
+            if self.negative_ttl is not None:
+                self.negative = _open_index(self.backend, self.cache_dir, 'negative', read_only)
+
+    def _cleanup(self) -> None:
+        """Remove stale data before the cache is closed. Does nothing unless overridden."""
+
+    def _flush_storage(self) -> None:
+        """
+        Write pending changes of entity data storage to disk, before the index
+        which refers to them. Does nothing unless overridden.
+        """
+
+    def _close_storage(self) -> None:
+        """Close entity data storage. Does nothing unless overridden."""
+
+    def _reload_storage(self) -> None:
+        """Reload entity data storage after a lock upgrade. Does nothing unless overridden."""
+
+    def _enforce_limits(self) -> None:
+        assert self.index is not None, 'index is None'
+
+        if not self.stored:
+            return
+
+        if ((self.max_entries is not None and len(self.index) > self.max_entries)
+                or self.max_bytes is not None):
+            evicted = self.evict(self.max_entries, self.max_bytes)
+            if evicted:
+                print('Evicted', len(evicted), 'cache entries.')
+
+    def _entry_sizes(self, _entries: List[Tuple[str, Dict]], _record: bool) -> Dict[str, int]:
+        """
+        Return the number of bytes of data stored for each MBID of the index
+        entries, besides the index. If record is True, sizes which had to be
+        found out from the stored data are recorded in the index entries. Does
+        nothing unless overridden.
+        """
+        return {}
+
+    @_writing
+    def evict(self,
+              max_entries: Optional[int] = None,
+              max_bytes: Optional[int] = None,
+              dry_run: bool = False) -> List[Tuple[str, Dict]]:
+        """
+        Evict entries until the cache holds at most max_entries entries and at
+        most max_bytes bytes of entity data. Non-permanent entries are evicted
+        in order of their last lookup time (or last update time, if they were
+        never looked up), oldest first. Expired negative entries are removed
+        as well. Return the evicted (key, entry) pairs. If dry_run is True,
+        nothing is removed.
+        """
+        if not dry_run:
+            self._prepare_write()
+        assert self.index is not None, 'index is None'
+
+        entries = list(self.index.items())
+        sizes = {}
+        if max_bytes is not None:
+            sizes = self._entry_sizes(entries, not dry_run)
+        total_entries = len(entries)
+        total_bytes = sum(sizes.values())
+
+        if ((max_entries is None or total_entries <= max_entries)
+                and (max_bytes is None or total_bytes <= max_bytes)):
+            if not dry_run:
+                self._remove_expired_negative()
+            return []
+
+        references: Dict[str, int] = {}
+        for _, entry in entries:
+            references[entry['id']] = references.get(entry['id'], 0) + 1
+
+        candidates = sorted((item for item in entries if not item[1].get('permanent', False)),
+                            key=lambda item: self._last_access(*item))
+        evicted = []
+
+        for key, entry in candidates:
+            if ((max_entries is None or total_entries <= max_entries)
+                    and (max_bytes is None or total_bytes <= max_bytes)):
+                break
+
+            evicted.append((key, entry))
+            total_entries -= 1
+            references[entry['id']] -= 1
+            if references[entry['id']] == 0:
+                total_bytes -= sizes.get(entry['id'], 0)
+
+        if not dry_run:
+            for key, _ in evicted:
+                self.index.delete(key)
+                if self.fuzzy is not None:
+                    self.fuzzy.remove(key)
+            self._remove_expired_negative()
+
+        return evicted
+
+    def _remove_expired_negative(self) -> None:
+        if self.negative is None:
+            return
+
+        assert self.negative_ttl is not None, 'negative_ttl is None'
+        now = int(time.time())
+        for key, entry in list(self.negative.items()):
+            if now - entry['last_update'] >= self.negative_ttl:
+                self.negative.delete(key)
+
+    @_writing
+    def compact(self) -> None:
+        """Compact the on-disk index storage, if the index backend supports it."""
+        self._prepare_write()
+        assert self.index is not None, 'index is None'
+        self.index.compact()
+
+    @_writing
+    def flush(self) -> None:
+        """
+        Write pending changes to disk without closing the cache. Release data
+        orphaned by the changes is removed, as on close.
+        """
+        assert self.index is not None, 'index is None'
+
+        if not self.lock.exclusive:
+            return
+
+        with self.metrics.timer('index.flush'):
+            self._flush_storage()
+            self.index.flush()
+            if self.negative is not None:
+                self.negative.flush()
+            self.access.flush()
+        self._cleanup()
+
+    def _prepare_write(self) -> None:
+        """Make sure the cache holds an exclusive lock before modifying it."""
+        assert self.index is not None, 'index is None'
+
+        if self.lock.exclusive:
+            return
+
+        self.lock.upgrade()
+
+        # another process may have modified the cache during the upgrade
+        self.index.close()
+        if self.negative is not None:
+            self.negative.close()
+        self._open_indexes(read_only=False)
+        self._reload_storage()
+        self.fuzzy = None
+
+    def _last_access(self, key: str, entry: Dict) -> int:
+        # lookup times recorded in the index by earlier versions are still honored
+        logged = self.access.get(key) or 0
+        return max(logged, entry.get('last_lookup') or 0) or entry['last_update']
+
+    def _touch_entry(self, key: str, _entry: Dict) -> None:
+        if self.read_only:
+            return
+
+        # lookups run in parallel, but the log is written by one at a time
+        with self.mutex:
+            self.access.touch(key, int(time.time()))
 
     def _find_mbid_in_index(self, params: _EntityParams) -> Optional[str]:
-        assert self.cache is not None, 'cache is None'
+        assert self.index is not None, 'index is None'
 
-        try:
-            entry = self.cache[params.key()]
-            entry['last_lookup'] = int(time.time())
-            self.update_required = True
-            return entry['id']
-        except KeyError:
+        key = params.key()
+        entry = self.index.get(key)
+        if entry is None:
+            self.metrics.count('lookup.miss')
             return None
 
-    def _store_mbid_in_index(self, mbid: str, params: _EntityParams) -> None:
-        assert self.cache is not None, 'cache is None'
+        self.metrics.count('lookup.hit')
+        self._touch_entry(key, entry)
+        return entry['id']
+
+    def _store_mbid_in_index(self, mbid: str, params: _EntityParams, **extra) -> None:
+        self._store_mbid_under_key(mbid, params.key(), **extra)
+
+    def _store_mbid_under_key(self, mbid: str, key: str, **extra) -> None:
+        self._prepare_write()
+        assert self.index is not None, 'index is None'
 
         entry = {
             'id': mbid,
             'last_update': int(time.time()),
             'last_lookup': None,
+            **extra,
         }
 
-        self.cache[params.key()] = entry
-        self.update_required = True
+        self.index.put(key, entry)
+        self._remove_negative(key)
+        self.stored = True
+        self.metrics.count('store')
+
+        if self.fuzzy is not None:
+            self.fuzzy.add(key)
+
+    @_reading
+    def is_negative(self, key: str) -> bool:
+        """
+        Check if a search or lookup identified by the key has recently failed.
+        The key is a cache key of entity parameters or an MBID.
+        """
+        if self.negative is None:
+            return False
+
+        entry = self.negative.get(key)
+        if entry is None:
+            return False
+
+        assert self.negative_ttl is not None, 'negative_ttl is None'
+        if int(time.time()) - entry['last_update'] >= self.negative_ttl:
+            return False
+
+        self.metrics.count('negative.hit')
+        return True
+
+    @_writing
+    def store_negative(self, key: str) -> None:
+        """Record that a search or lookup identified by the key has failed."""
+        if self.negative is None:
+            return
+
+        self._prepare_write()
+        assert self.negative is not None, 'negative is None'
+        self.negative.put(key, {'id': '', 'last_update': int(time.time())})
+        self.metrics.count('negative.store')
+
+    def _remove_negative(self, key: str) -> None:
+        if self.negative is not None and key in self.negative:
+            self.negative.delete(key)
+
+    @_reading
+    def similar(self,
+                params: _EntityParams,
+                min_score: float = 0.8,
+                limit: int = 5) -> List[Tuple[str, str, float]]:
+        """
+        Find cached entries whose keys are similar to the key of the entity
+        parameters (see mbcache.fuzzy). Return at most limit (key, MBID,
+        similarity) tuples with similarity of at least min_score, best first.
+        The index of keys is built in memory when it is first needed.
+        """
+        assert self.index is not None, 'index is None'
+
+        with self.mutex:
+            if self.fuzzy is None:
+                self.fuzzy = _TrigramIndex(key for key, _ in self.index.items())
+
+        found = []
+        for key, score in self.fuzzy.search(params.key(), min_score, limit):
+            entry = self.index.get(key)
+            if entry is not None:
+                found.append((key, entry['id'], score))
+
+        return found
+
+    @_writing
+    def alias(self, params: _EntityParams, key: str) -> None:
+        """Store the MBID stored under the key also under the key of the entity parameters."""
+        self._prepare_write()
+        assert self.index is not None, 'index is None'
+
+        entry = self.index.get(key)
+        if entry is None:
+            raise KeyError(key)
 
+        self._store_mbid_under_key(entry['id'], params.key())
+
+    @_reading
     def exists(self, params: _EntityParams) -> bool:
         """Check if specified entry exists in the cache."""
-        assert self.cache is not None, 'cache is None'
-        return params.key() in self.cache.keys()
+        assert self.index is not None, 'index is None'
+        return params.key() in self.index
 
     def lookup(self, _params: _EntityParams) -> Optional[_EntityData]:
         """Retrieve entity data from the cache."""
@@ -86,9 +449,10 @@ class _RecordingCache(_Cache):
     """
     Cache for storing recording MBIDs.
 
-    Cache is stored in JSON file in user's XDG cache directory. The path is
-    derived from application name and cache name, passed as arguments to the
-    class constructor.
+    Cache is stored in user's XDG cache directory. The path is derived from
+    application name and cache name, passed as arguments to the class
+    constructor. The index storage format is selected with the backend
+    argument (see mbcache.index).
 
     Objects are stored in key-value format, where the key is derived from
     artist name, track title and album title, and the value is the recording
@@ -97,10 +461,12 @@ class _RecordingCache(_Cache):
     Cache stores times of last update and last lookup as UNIX timestamps.
     """
 
+    @_reading
     def lookup(self, params: _EntityParams) -> Optional[str]:
         """Look up a recording MBID by artist, title and album."""
         return self._find_mbid_in_index(params)
 
+    @_writing
     def store(self, mbid: _EntityData, params: _EntityParams) -> None:
         """Store a recording MBID in cache."""
         assert isinstance(mbid, str), 'mbid is not a str'
@@ -115,7 +481,24 @@ class _ReleaseCache(_Cache):
     is derived from application name and cache name passed as arguments to the
     class constructor. It contains JSON files with release data, whose names
     are derived from MusicBrainz release MBIDs. It additionally contains a
-    key-value index file, which maps keys to release MBIDs.
+    key-value index, which maps keys to release MBIDs. The index storage
+    format is selected with the backend argument (see mbcache.index).
+
+    Release files are written as indented JSON, or as compressed compact JSON
+    if compression is set to 'gzip', 'lzma' or 'zlib'. Files in any of these
+    formats can be read regardless of the compression setting. If layout is
+    'sharded', new files are placed in two levels of subdirectories named
+    after MBID prefixes, and existing files are moved there when the cache is
+    opened (unless it is read-only).
+
+    If storage is 'pack', release data is appended to large pack files instead
+    of being stored in separate files (see mbcache.release_store). The storage
+    engine is recorded in the cache directory, and is used if storage is None.
+    A cache of separate files can be opened as 'pack' (and convert_storage()
+    moves its files into packs), but not the other way round. Space used
+    by replaced releases is reclaimed by repack(). The size of release data
+    is recorded in its index entry when it is written, so that the max_bytes
+    limit is enforced without checking the size of every stored release.
 
     Index keys are derived from artist names and release titles, which must be
     unique. To make it possible to keep multiple versions of the same album in
@@ -129,40 +512,281 @@ class _ReleaseCache(_Cache):
     stored is the permanence information. If cache entry is set as permanent,
     it will never be invalidated or updated automatically (but can still be
     replaced as described above).
+
+    Decoded release data can be kept in an in-memory LRU cache, limited to
+    lru_entries releases and lru_bytes bytes of release files (None means no
+    limit). The LRU cache is disabled by default (lru_entries=0). Releases
+    returned from the LRU cache are shared between lookups and must not be
+    modified.
+
+    If max_age is set, non-permanent entries last updated more than max_age
+    seconds ago are stale. Stale entries are still returned by lookups, but
+    their keys and MBIDs are collected, so that the caller can refresh them
+    (see take_stale() and refresh()). Read-only caches do not collect stale
+    entries.
+
+    If track_index is True, the cache also maintains an index of recordings
+    found in the tracklists of cached releases, keyed as in the recordings
+    cache (see find_recording()). The index is built from all cached
+    releases when the cache is first locked exclusively and the index has not
+    been completely built and written yet, and it is updated when releases
+    are stored. If releases are stored by a cache opened without track_index,
+    the index is rebuilt the next time it is opened. Recordings stay in the
+    index when their releases are removed, since their MBIDs remain valid.
     """
 
-    def __del__(self):
-        if self.cache is not None:
-            self._remove_orphans()
-        super().__del__()
-
-    def _remove_orphans(self) -> None:
-        assert self.cache is not None, 'cache is None'
-
-        in_cache = set(
-            glob.glob(os.path.join(self.cache_dir, '????????-????-????-????-????????????.json')))
-        in_index = {
-            os.path.join(self.cache_dir, entry['id'] + '.json')
-            for entry in self.cache.values()
-        }
-        orphans = in_cache - in_index
-        num_orphans = len(orphans)
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 application: str,
+                 cache_name: str,
+                 *,
+                 lru_entries: Optional[int] = 0,
+                 lru_bytes: Optional[int] = None,
+                 compression: Optional[str] = None,
+                 layout: str = 'flat',
+                 storage: Optional[str] = None,
+                 max_age: Optional[int] = None,
+                 track_index: bool = False,
+                 **options):
+        self.max_age = max_age
+        self.tracks: Optional[_Index] = None
+        self.tracks_marker = ''
+        self.stale: Dict[str, str] = {}
+        self.orphans: Set[str] = set()
+        self.releases = _LruCache(lru_entries, lru_bytes)
+        self._store: Optional[_ReleaseStore] = None
+        super().__init__(application, cache_name, **options)
+        # present once the track index has been built and written to disk,
+        # and removed when a release is stored without updating the index
+        self.tracks_marker = os.path.join(self.cache_dir, 'tracks.built')
 
-        for i in orphans:
-            os.remove(i)
+        try:
+            storage = _resolve_storage(self.cache_dir, storage, self.read_only)
+        except ValueError:
+            self.close()
+            raise
+
+        if storage == 'pack':
+            self._store = _PackReleaseStore(self.cache_dir, compression, self.backend,
+                                            self.read_only)
+        else:
+            self._store = _FileReleaseStore(self.cache_dir, compression, layout)
+
+        if not self.read_only:
+            moved = self.store_engine.migrate_layout()
+            if moved > 0:
+                print('Moved', moved, 'release files to the', layout, 'layout.')
+
+        if track_index:
+            self.tracks = _open_index(self.backend, self.cache_dir, 'tracks', self.read_only)
+            if not self.read_only:
+                self._complete_track_index()
+
+    @property
+    def store_engine(self) -> _ReleaseStore:
+        """Storage engine of release data."""
+        assert self._store is not None, 'store is None'
+        return self._store
+
+    def _flush_storage(self) -> None:
+        if self._store is not None:
+            self._store.flush()
+
+        if self.tracks is not None:
+            self.tracks.flush()
+            if not os.path.exists(self.tracks_marker):
+                with open(self.tracks_marker, 'w', encoding='utf-8'):
+                    pass
+
+    def _close_storage(self) -> None:
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+        if self.tracks is not None:
+            self.tracks.close()
+            self.tracks = None
+
+    def _reload_storage(self) -> None:
+        if self._store is not None:
+            self._store.reload()
+
+        if self.tracks is not None:
+            self.tracks.close()
+            self.tracks = _open_index(self.backend, self.cache_dir, 'tracks')
+            self._complete_track_index()
+
+    def _index_tracks(self, release_data: Dict) -> int:
+        assert self.tracks is not None, 'tracks is None'
+
+        if 'medium-list' not in release_data:
+            return 0
+
+        tracklist = _make_tracklist(release_data)
+        for mbid, params in tracklist:
+            self.tracks.put(params.key(), {'id': mbid, 'release': release_data['id']})
+
+        return len(tracklist)
+
+    def _complete_track_index(self) -> None:
+        """Build the track index, unless it has been built and written before."""
+        assert self.tracks is not None, 'tracks is None'
+
+        if self.tracks.created or not os.path.exists(self.tracks_marker):
+            print('Indexed', self._build_track_index(), 'recordings of cached releases.')
+
+    def _build_track_index(self) -> int:
+        assert self.index is not None, 'index is None'
+
+        indexed = 0
+        for mbid in self.index.ids():
+            raw = self.store_engine.read(mbid)
+            if raw is not None:
+                indexed += self._index_tracks(json.loads(raw))
+
+        return indexed
+
+    @_reading
+    def find_recording(self, params: _EntityParams) -> Optional[str]:
+        """
+        Look up a recording MBID by artist, title and album in the tracklists
+        of cached releases. Return None if there is no track index.
+        """
+        if self.tracks is None:
+            return None
 
-        if num_orphans > 0:
-            print('Removed', num_orphans, 'orphaned cache files.')
+        entry = self.tracks.get(params.key())
+        if entry is None:
+            return None
 
-    def _load_release_data(self, mbid: str) -> Optional[Dict]:
-        release_file = os.path.join(self.cache_dir, mbid + '.json')
+        self.metrics.count('lookup.track_index')
+        return entry['id']
+
+    def _cleanup(self) -> None:
+        assert self.index is not None, 'index is None'
+
+        if self._store is None:
+            return
+
+        removed = 0
+        for mbid in self.orphans:
+            if self.index.find_key(mbid) is None:
+                self.store_engine.remove(mbid)
+                removed += 1
+        self.orphans.clear()
+
+        if removed > 0:
+            print('Removed', removed, 'orphaned cache files.')
+
+    def _entry_sizes(self, entries: List[Tuple[str, Dict]], record: bool) -> Dict[str, int]:
+        assert self.index is not None, 'index is None'
+        sizes: Dict[str, int] = {}
+        updated: Dict[str, int] = {}
+
+        # the size recorded by the latest write of the release data is current
+        for _, entry in entries:
+            mbid = entry['id']
+            if 'size' in entry and entry['last_update'] >= updated.get(mbid, 0):
+                sizes[mbid] = entry['size']
+                updated[mbid] = entry['last_update']
+
+        # entries written by earlier versions have no recorded size, so it is
+        # recorded now, to check the stored data only once
+        checked: Set[str] = set()
+        for key, entry in entries:
+            mbid = entry['id']
+            if mbid not in sizes:
+                sizes[mbid] = self.store_engine.size(mbid)
+                checked.add(mbid)
+
+            if record and mbid in checked:
+                entry['size'] = sizes[mbid]
+                self.index.put(key, entry)
+
+        return sizes
+
+    @_writing
+    def evict(self,
+              max_entries: Optional[int] = None,
+              max_bytes: Optional[int] = None,
+              dry_run: bool = False) -> List[Tuple[str, Dict]]:
+        evicted = super().evict(max_entries, max_bytes, dry_run)
+
+        if not dry_run:
+            for _, entry in evicted:
+                self.orphans.add(entry['id'])
+                self.releases.invalidate(entry['id'])
+
+        return evicted
+
+    @_writing
+    def remove_orphans(self) -> int:
+        """
+        Check the whole cache directory for release files which are not
+        referenced by the index, and remove them. Return the number of removed
+        files. Files orphaned by this process are removed on close without
+        a full check, so this is needed only to clean up after other failures.
+        """
+        self._prepare_write()
+        assert self.index is not None, 'index is None'
 
-        try:
-            with open(release_file, encoding='utf-8') as rel:
-                return json.load(rel)
-        except FileNotFoundError:
+        orphans = self.store_engine.mbids() - self.index.ids()
+
+        for mbid in orphans:
+            self.store_engine.remove(mbid)
+
+        return len(orphans)
+
+    def _load_release_data(self, mbid: str) -> Optional[Dict]:
+        release = self.releases.get(mbid)
+        if release is not None:
+            self.metrics.count('release.lru_hit')
+            return release
+
+        with self.metrics.timer('release.read'):
+            raw = self.store_engine.read(mbid)
+        if raw is None:
             return None
 
+        self.metrics.count('bytes.read', len(raw))
+        with self.metrics.timer('release.decode'):
+            release = json.loads(raw)
+        self.releases.put(mbid, release, len(raw))
+        return release
+
+    def lru_stats(self) -> Dict[str, int]:
+        """Return hit and miss counters of the in-memory release LRU cache."""
+        return self.releases.stats()
+
+    def _touch_entry(self, key: str, entry: Dict) -> None:
+        super()._touch_entry(key, entry)
+
+        if (self.max_age is not None and not self.read_only and not entry.get('permanent', False)
+                and int(time.time()) - entry['last_update'] > self.max_age):
+            with self.mutex:
+                self.stale[entry['id']] = key
+
+    def take_stale(self) -> Dict[str, str]:
+        """
+        Return stale entries found by lookups since the previous call, as
+        a dictionary mapping release MBIDs to cache keys.
+        """
+        with self.mutex:
+            stale, self.stale = self.stale, {}
+        return stale
+
+    @_writing
+    def refresh(self, key: str, release_data: Dict) -> None:
+        """
+        Replace release data stored under the key with newly fetched data.
+        Unlike store(), keep the permanence of the entry.
+        """
+        assert self.index is not None, 'index is None'
+        entry = self.index.get(key)
+        permanent = entry.get('permanent', False) if entry is not None else False
+        self._store_release(key, release_data, permanent)
+
+    @_reading
     def lookup(self, params: _EntityParams) -> Optional[Dict]:
         """
         Look up release data by artist, title
@@ -174,31 +798,81 @@ class _ReleaseCache(_Cache):
 
         return self._load_release_data(mbid)
 
+    @_reading
     def lookup_id(self, mbid: str) -> Optional[Dict]:
         """Look up release information by MBID."""
-        assert self.cache is not None, 'cache is None'
+        assert self.index is not None, 'index is None'
 
-        index_mbids = [entry['id'] for entry in self.cache.values()]
-        if mbid not in index_mbids:
+        key = self.index.find_key(mbid)
+        if key is None:
+            self.metrics.count('lookup.miss')
             return None
 
-        rev_index = {val['id']: key for key, val in self.cache.items()}
-        mbid_key = rev_index[mbid]
-        self.cache[mbid_key]['last_lookup'] = int(time.time())
-        self.update_required = True
+        self.metrics.count('lookup.hit')
+        entry = self.index.get(key)
+        assert entry is not None, 'reverse index out of sync'
+        self._touch_entry(key, entry)
 
         return self._load_release_data(mbid)
 
+    @_writing
     def store(self, release_data: _EntityData, params: _EntityParams) -> None:
         """Store release data in cache, with optional disambiguation string."""
-        assert self.cache is not None, 'cache is None'
         assert isinstance(release_data, dict), 'release_data is not a dict'
+        self._store_release(params.key(), release_data, permanent=False)
+
+    def _store_release(self, key: str, release_data: Dict, permanent: bool) -> None:
+        self._prepare_write()
+        assert self.index is not None, 'index is None'
+
+        replaced = self.index.get(key)
+        if replaced is not None:
+            self.releases.invalidate(replaced['id'])
+            if replaced['id'] != release_data['id']:
+                self.orphans.add(replaced['id'])
 
         mbid = release_data['id']
-        self._store_mbid_in_index(mbid, params)
-        self.cache[params.key()]['permanent'] = False
+        self.releases.invalidate(mbid)
+        size = self.store_engine.write(mbid, release_data)
+        self._store_mbid_under_key(mbid, key, permanent=permanent, size=size)
+        self.metrics.count('bytes.written', size)
+
+        if self.tracks is not None:
+            self._index_tracks(release_data)
+        else:
+            try:
+                os.remove(self.tracks_marker)
+            except FileNotFoundError:
+                pass
+
+    @_writing
+    def repack(self) -> int:
+        """
+        Reclaim space used by replaced releases, if release data is stored in
+        pack files. Return the number of reclaimed bytes.
+        """
+        self._prepare_write()
+
+        if not isinstance(self.store_engine, _PackReleaseStore):
+            return 0
+
+        self.releases.clear()
+        return self.store_engine.repack()
+
+    @_writing
+    def convert_storage(self) -> int:
+        """
+        Rewrite all release files stored in a format other than the current
+        one. Return the number of converted files.
+        """
+        self._prepare_write()
+        assert self.index is not None, 'index is None'
+
+        converted = {mbid for mbid in self.index.ids() if self.store_engine.convert(mbid)}
 
-        release_file = os.path.join(self.cache_dir, mbid + '.json')
+        for key, entry in list(self.index.items()):
+            if entry['id'] in converted and 'size' in entry:
+                entry['size'] = self.store_engine.size(entry['id'])
+                self.index.put(key, entry)
 
-        with open(release_file, 'w', encoding='utf-8') as rel:
-            json.dump(release_data, rel, indent=1)
+        return len(converted)
@@ -0,0 +1,107 @@
+"""
+Shrink a cache by evicting least recently used entries, and check the release
+cache for orphaned files.
+"""
+
+import argparse
+import sys
+
+from mbcache.cache import _Cache, _RecordingCache, _ReleaseCache
+from mbcache.version import APPNAME, VERSION
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description='Shrink a cache by evicting least recently used entries.')
+
+    parser.add_argument('cache', choices=['recordings', 'releases'], help='type of the cache')
+
+    parser.add_argument('-e',
+                        '--max-entries',
+                        type=int,
+                        default=None,
+                        help='maximum number of entries to keep')
+
+    parser.add_argument('-s',
+                        '--max-bytes',
+                        type=int,
+                        default=None,
+                        help='maximum size of release files to keep, in bytes')
+
+    parser.add_argument('-c',
+                        '--cache-name',
+                        default=None,
+                        help='name of the cache (default: same as cache type)')
+
+    parser.add_argument('-b',
+                        '--backend',
+                        default=None,
+                        help='index backend of the cache (default: as recorded in the cache)')
+
+    parser.add_argument('-S',
+                        '--storage',
+                        choices=['files', 'pack'],
+                        default=None,
+                        help='storage engine of the release cache (default: as recorded in it)')
+
+    parser.add_argument('-o',
+                        '--remove-orphans',
+                        action='store_true',
+                        help='check for and remove orphaned release files')
+
+    parser.add_argument('-r',
+                        '--repack',
+                        action='store_true',
+                        help='reclaim space in release pack files')
+
+    parser.add_argument('-n',
+                        '--dry-run',
+                        action='store_true',
+                        help='do not evict, just show what would be evicted')
+
+    parser.add_argument('-v', '--version', action='version', version=VERSION)
+
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+
+    if (args.max_entries is None and args.max_bytes is None and not args.remove_orphans
+            and not args.repack):
+        sys.exit('At least one of --max-entries, --max-bytes, --remove-orphans and --repack '
+                 'is required!')
+
+    if (args.remove_orphans or args.repack) and args.cache != 'releases':
+        sys.exit('Only the releases cache has release files!')
+
+    options = {'backend': args.backend, 'read_only': args.dry_run}
+    if args.cache == 'releases':
+        options['storage'] = args.storage
+
+    cache_class = _RecordingCache if args.cache == 'recordings' else _ReleaseCache
+    cache: _Cache = cache_class(APPNAME, args.cache_name or args.cache, **options)
+
+    if args.remove_orphans and not args.dry_run:
+        assert isinstance(cache, _ReleaseCache), 'not a release cache'
+        print(f'Removed {cache.remove_orphans()} orphaned release files.')
+
+    if args.max_entries is not None or args.max_bytes is not None:
+        evicted = cache.evict(args.max_entries, args.max_bytes, args.dry_run)
+
+        if args.dry_run:
+            for key, entry in evicted:
+                print(f'Would evict: {key} ({entry["id"]})')
+            print(f'Would evict {len(evicted)} entries.')
+        else:
+            print(f'Evicted {len(evicted)} entries.')
+
+    if args.repack and not args.dry_run:
+        assert isinstance(cache, _ReleaseCache), 'not a release cache'
+        print(f'Reclaimed {cache.repack()} bytes in release pack files.')
+
+    cache.close()
+
+
+if __name__ == '__main__':
+    main()
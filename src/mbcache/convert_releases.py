@@ -0,0 +1,64 @@
+"""Convert cached release files to a different storage format or layout."""
+
+import argparse
+
+from mbcache.cache import _ReleaseCache
+from mbcache.version import APPNAME, VERSION
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description='Convert cached release files to a different storage format or layout.')
+
+    parser.add_argument('-c',
+                        '--compression',
+                        choices=['none', 'gzip', 'lzma', 'zlib'],
+                        default='none',
+                        help='compression of converted release files (default: %(default)s)')
+
+    parser.add_argument('-l',
+                        '--layout',
+                        choices=['flat', 'sharded'],
+                        default='flat',
+                        help='directory layout of converted release files (default: %(default)s)')
+
+    parser.add_argument('-s',
+                        '--storage',
+                        choices=['files', 'pack'],
+                        default=None,
+                        help='storage engine to move release files to (default: as recorded in '
+                        'the cache)')
+
+    parser.add_argument('-n',
+                        '--cache-name',
+                        default='releases',
+                        help='name of the release cache (default: %(default)s)')
+
+    parser.add_argument('-b',
+                        '--backend',
+                        default=None,
+                        help='index backend of the cache (default: as recorded in the cache)')
+
+    parser.add_argument('-v', '--version', action='version', version=VERSION)
+
+    return parser.parse_args()
+
+
+def main():
+    args = _parse_args()
+    compression = None if args.compression == 'none' else args.compression
+
+    cache = _ReleaseCache(APPNAME,
+                          args.cache_name,
+                          compression=compression,
+                          layout=args.layout,
+                          storage=args.storage,
+                          backend=args.backend)
+    converted = cache.convert_storage()
+    cache.close()
+
+    print(f'Converted {converted} release files.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,33 @@
-"""Copy recordings from a release to the recordings cache."""
+"""
+Copy recordings from a release to the recordings cache.
+
+In bulk mode, releases are read from a file (or standard input), one per
+line, in one of the following formats:
+
+- a release MBID,
+- tab-separated artist, title and optional disambiguation string,
+- a JSON object with either 'mbid' or 'artist' and 'title' keys, and an
+  optional 'disambiguation' key.
+
+Empty lines and lines starting with '#' are ignored. Both caches are opened
+only once, releases missing from the cache are looked up concurrently, and
+the recordings cache index is written once, when all releases are copied.
+
+Releases given by artist and title are searched for, and ambiguous search
+results are resolved by the selection policy. Unattended runs should select
+results by score, deferring the rest to a review queue file. Interactive
+selection cannot be used when releases are read from standard input.
+"""
 
 import argparse
+import json
+import re
 import sys
-from typing import Dict, List, Optional, Tuple
-
-from mbnames import remove_featured
+from typing import Dict, Iterable, List, Optional, Tuple, TypedDict
 
-from mbcache import MbRecordingCache, MbReleaseCache
-from mbcache.params import _RecordingParams
+from mbcache import (DeferredSelection, InteractiveSelection, MbRecordingCache, MbReleaseCache,
+                     ScoreSelection, SelectionPolicy)
+from mbcache.tracklist import _make_tracklist
 from mbcache.version import VERSION
 
 
@@ -15,8 +35,35 @@ def _parse_args():
     parser = argparse.ArgumentParser(
         description='Copy recordings from a release to the recordings cache.')
 
-    parser.add_argument('artist', help='artist name')
-    parser.add_argument('title', help='release title')
+    parser.add_argument('artist', nargs='?', help='artist name')
+    parser.add_argument('title', nargs='?', help='release title')
+
+    parser.add_argument('-i',
+                        '--input',
+                        default=None,
+                        help='read releases from this file (- for standard input)')
+
+    parser.add_argument('-b',
+                        '--backend',
+                        default=None,
+                        help='index backend of the caches (default: as recorded in them)')
+
+    parser.add_argument('-s',
+                        '--selection',
+                        choices=['interactive', 'score'],
+                        default='interactive',
+                        help='how to select one of many search results (default: %(default)s)')
+
+    parser.add_argument('-q',
+                        '--review-queue',
+                        default=None,
+                        help='with score selection, append unresolved searches to this file')
+
+    parser.add_argument('-w',
+                        '--workers',
+                        type=int,
+                        default=4,
+                        help='number of concurrent MusicBrainz lookups (default: %(default)s)')
 
     parser.add_argument('-d',
                         '--disambiguation',
@@ -35,48 +82,73 @@ def _parse_args():
 
     parser.add_argument('-v', '--version', action='version', version=VERSION)
 
-    return parser.parse_args()
+    args = parser.parse_args()
+
+    if (args.input is None) == (args.artist is None or args.title is None):
+        parser.error('either artist and title, or --input is required')
+
+    if args.input == '-' and args.selection == 'interactive':
+        parser.error('interactive selection cannot read answers when releases are read '
+                     'from standard input; use --selection score')
+
+    if args.review_queue is not None and args.selection != 'score':
+        parser.error('--review-queue requires --selection score')
+
+    return args
+
+
+_MBID_PATTERN = re.compile('^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+
+class _Release(TypedDict, total=False):
+    """A release given by MBID, or by artist, title and optional disambiguation string."""
+    mbid: str
+    artist: str
+    title: str
+    disambiguation: Optional[str]
+
+
+def _parse_release(line: str) -> _Release:
+    if line.startswith('{'):
+        release = json.loads(line)
+    elif _MBID_PATTERN.match(line):
+        release = {'mbid': line}
+    else:
+        fields = line.split('\t')
+        release = dict(zip(('artist', 'title', 'disambiguation'), fields))
 
+    if 'mbid' not in release and ('artist' not in release or 'title' not in release):
+        raise ValueError(f'release has neither an MBID nor an artist and title: {line}')
 
-def _make_tracklist(release: Dict,
-                    feat_string: Optional[str]) -> List[Tuple[str, _RecordingParams]]:
-    tracklist = []
-    album = release['title']
+    return release
 
-    for medium in release['medium-list']:
-        tracks = medium['track-list']
-        if 'pregap' in medium:
-            # include pregap track if it exists in the medium.
-            tracks = [medium['pregap']] + medium['track-list']
 
-        for track in tracks:
-            # skip video tracks
-            if track['recording'].get('video', False):
-                continue
+def _read_releases(lines: Iterable[str]) -> List[_Release]:
+    releases = []
 
-            # prefer track title over recording title
-            try:
-                title = track['title']
-            except KeyError:
-                title = track['recording']['title']
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        try:
+            releases.append(_parse_release(line))
+        except ValueError as exc:
+            sys.exit(f'Invalid release on line {number}: {exc}')
 
-            artist = track['artist-credit-phrase']
-            if len(track['artist-credit']) == 1:
-                # use canonical names on non-compound artists by default
-                artist = track['artist-credit'][0]['artist']['name']
+    return releases
 
-            artist = remove_featured(artist, feat_string)
 
-            mbid = track['recording']['id']
-            params = _RecordingParams(artist, title, album)
-            tracklist.append((mbid, params))
+def _make_selection(args) -> SelectionPolicy:
+    if args.selection == 'interactive':
+        return InteractiveSelection()
 
-    return tracklist
+    fallback = None if args.review_queue is None else DeferredSelection(args.review_queue)
+    return ScoreSelection(fallback=fallback)
 
 
 # pylint: disable=protected-access
-def _convert_release(release: Dict, args) -> None:
-    cache = MbRecordingCache()
+def _convert_release(release: Dict, cache: MbRecordingCache, args) -> int:
     added = 0
 
     for track in _make_tracklist(release, args.feat_string):
@@ -93,19 +165,80 @@ def _convert_release(release: Dict, args) -> None:
         cache._cache.store(mbid, params)
         added += 1
 
+    return added
+
+
+def _get_releases(cache: MbReleaseCache, releases: List[_Release]) -> List[Optional[Dict]]:
+    """Get all releases, looking up the ones given by MBID concurrently."""
+    by_disambiguation: Dict[Optional[str], List[str]] = {}
+    for release in releases:
+        if 'mbid' in release:
+            by_disambiguation.setdefault(release.get('disambiguation'), []).append(release['mbid'])
+
+    found: Dict[Tuple[str, Optional[str]], Optional[Dict]] = {}
+    for disambiguation, mbids in by_disambiguation.items():
+        for mbid, data in zip(mbids, cache.get_many(mbids, disambiguation)):
+            found[(mbid, disambiguation)] = data
+
+    result = []
+    for release in releases:
+        if 'mbid' in release:
+            result.append(found[(release['mbid'], release.get('disambiguation'))])
+        else:
+            result.append(
+                cache.get(release['artist'], release['title'], release.get('disambiguation')))
+
+    return result
+
+
+def _copy_releases(args) -> None:
+    if args.input == '-':
+        requested = _read_releases(sys.stdin)
+    else:
+        with open(args.input, encoding='utf-8') as input_file:
+            requested = _read_releases(input_file)
+
+    releases = MbReleaseCache(fetch_workers=args.workers,
+                              selection=_make_selection(args),
+                              backend=args.backend)
+    found = _get_releases(releases, requested)
+    releases.close()
+
+    cache = MbRecordingCache(backend=args.backend)
+    added = 0
+    failed = 0
+
+    for request, release in zip(requested, found):
+        if release is None:
+            print('Failed to get the release:', request.get('mbid') or request.get('title'))
+            failed += 1
+            continue
+
+        added += _convert_release(release, cache, args)
+
+    cache.close()
+
     if added > 0:
-        print(f'Added {added} recordings to the cache.')
+        print(f'Added {added} recordings from {len(requested) - failed} releases to the cache.')
 
 
 def main():
     args = _parse_args()
-    releases = MbReleaseCache()
+
+    if args.input is not None:
+        _copy_releases(args)
+        return
+
+    releases = MbReleaseCache(selection=_make_selection(args), backend=args.backend)
     release = releases.get(args.artist, args.title, args.disambiguation)
 
     if release is None:
         sys.exit('Failed to get the release!')
 
-    _convert_release(release, args)
+    added = _convert_release(release, MbRecordingCache(backend=args.backend), args)
+
+    if added > 0:
+        print(f'Added {added} recordings to the cache.')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,178 @@
+"""
+Serve the recordings and releases caches to other processes over a Unix
+domain socket.
+
+The daemon opens each cache once and keeps it open, so that its index is
+loaded only once, and processes using the caches through the daemon do not
+wait for each other's cache locks. Each client connection is served by its
+own thread. The protocol is described in mbcache.remote.
+
+Changes are written to disk every flush interval, and when the daemon is
+stopped with SIGINT or SIGTERM.
+"""
+
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+from typing import Dict, Type
+
+from mbcache.cache import _Cache, _RecordingCache, _ReleaseCache
+from mbcache.params import _EntityParams, _RecordingParams, _ReleaseParams
+from mbcache.remote import _default_socket_path, _encode
+from mbcache.version import APPNAME, VERSION
+
+_METHODS = {
+    'lookup', 'lookup_id', 'find_recording', 'similar', 'alias', 'store', 'exists', 'is_negative',
+    'store_negative', 'refresh'
+}
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description='Serve the recordings and releases caches over a Unix domain socket.')
+
+    parser.add_argument('-s',
+                        '--socket',
+                        default=None,
+                        help='path of the socket (default: daemon.sock in the cache directory)')
+
+    parser.add_argument('-r',
+                        '--recordings',
+                        default='recordings',
+                        help='name of the recordings cache (default: %(default)s)')
+
+    parser.add_argument('-R',
+                        '--releases',
+                        default='releases',
+                        help='name of the releases cache (default: %(default)s)')
+
+    parser.add_argument('-b',
+                        '--backend',
+                        default=None,
+                        help='index backend of the caches (default: as recorded in them)')
+
+    parser.add_argument('-t',
+                        '--negative-ttl',
+                        type=int,
+                        default=None,
+                        help='cache failed searches and lookups for this many seconds')
+
+    parser.add_argument('-T',
+                        '--track-index',
+                        action='store_true',
+                        help='index recordings found in tracklists of cached releases')
+
+    parser.add_argument('-f',
+                        '--flush-interval',
+                        type=int,
+                        default=60,
+                        help='seconds between writes of changes to disk (default: %(default)s)')
+
+    parser.add_argument('-v', '--version', action='version', version=VERSION)
+
+    return parser.parse_args()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Serve requests of one client connection."""
+
+    server: '_Server'
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                response = {'result': self.server.dispatch(json.loads(line))}
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                response = {'error': f'{type(exc).__name__}: {exc}'}
+
+            self.wfile.write(_encode(response))
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix domain socket server dispatching requests to the caches."""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, caches: Dict[str, _Cache]):
+        super().__init__(socket_path, _Handler)
+        self.caches = caches
+        self.params: Dict[str, Type[_EntityParams]] = {
+            name: _RecordingParams if isinstance(cache, _RecordingCache) else _ReleaseParams
+            for name, cache in caches.items()
+        }
+
+    def dispatch(self, request: Dict):
+        """Run the requested cache method and return its result."""
+        cache = self.caches.get(request['cache'])
+        if cache is None:
+            raise ValueError(f'unknown cache: {request["cache"]}')
+
+        method = request['method']
+        if method not in _METHODS or not hasattr(cache, method):
+            raise ValueError(f'unsupported method: {method}')
+
+        args = list(request.get('args', []))
+        if 'params' in request:
+            # releases are searched for recordings by recording parameters
+            params_class = (_RecordingParams
+                            if method == 'find_recording' else self.params[request['cache']])
+            args.append(params_class(*request['params']))
+
+        return getattr(cache, method)(*args, **request.get('kwargs', {}))
+
+
+def _flush_periodically(caches: Dict[str, _Cache], interval: int, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        for cache in caches.values():
+            cache.flush()
+
+
+def main():
+    args = _parse_args()
+    socket_path = args.socket or _default_socket_path()
+
+    if os.path.exists(socket_path):
+        sys.exit(f'Socket {socket_path} already exists! Is another daemon running?')
+
+    options = {'backend': args.backend, 'negative_ttl': args.negative_ttl}
+    recordings = _RecordingCache(APPNAME, args.recordings, **options)
+    # releases are sent to clients as copies, so they can be shared by the LRU cache
+    releases = _ReleaseCache(APPNAME,
+                             args.releases,
+                             lru_entries=16,
+                             track_index=args.track_index,
+                             **options)
+    caches: Dict[str, _Cache] = {args.recordings: recordings, args.releases: releases}
+
+    server = _Server(socket_path, caches)
+    stop = threading.Event()
+    flusher = threading.Thread(target=_flush_periodically,
+                               args=(caches, args.flush_interval, stop),
+                               daemon=True)
+    flusher.start()
+
+    # serve_forever() must be stopped from another thread
+    def _stop(_signum, _frame):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+
+    print(f'Serving caches on {socket_path}.')
+    try:
+        server.serve_forever()
+    finally:
+        stop.set()
+        flusher.join()
+        server.server_close()
+        os.remove(socket_path)
+        for cache in caches.values():
+            cache.close()
+
+
+if __name__ == '__main__':
+    main()
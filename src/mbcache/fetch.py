@@ -0,0 +1,90 @@
+"""
+Concurrent, rate-limited fetching of MusicBrainz data.
+
+Requests to the MusicBrainz web service are run by a pool of worker threads,
+so that the round-trip latency of one request is overlapped with others.
+Requests for the same entity which are submitted while an identical request
+is already in progress are coalesced into a single request.
+
+The request rate is limited by a token bucket, which the high-level caches
+share between the workers and the requests they make directly. The rate
+limiting built into musicbrainzngs is left in place: it only spaces out the
+start of requests, so it does not serialize the workers.
+"""
+
+import functools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable
+
+
+class _TokenBucket:
+    """
+    Thread-safe token bucket rate limiter. Tokens are added at the given rate
+    per second, up to burst tokens. Each request consumes one token.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take one token, waiting until it becomes available."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+
+                delay = (1.0 - self.tokens) / self.rate
+
+            time.sleep(delay)
+
+
+class _Fetcher:
+    """
+    Pool of worker threads running MusicBrainz requests. The requests are
+    expected to take a token from the rate limiter of their cache.
+
+    Each request is identified by a key. A request submitted while another
+    request with the same key is in progress is not run again: the future of
+    the request in progress is returned instead.
+    """
+
+    def __init__(self, workers: int = 4):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mbcache-fetch')
+        self.in_flight: Dict[Hashable, Future] = {}
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.coalesced = 0
+
+    def _finish(self, key: Hashable, _future: Future) -> None:
+        with self.lock:
+            del self.in_flight[key]
+
+    def submit(self, key: Hashable, function: Callable, *args) -> Future:
+        """Run function(*args) in a worker thread, unless key is already in flight."""
+        with self.lock:
+            future = self.in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+
+            future = self.executor.submit(function, *args)
+            self.in_flight[key] = future
+            self.requests += 1
+
+        future.add_done_callback(functools.partial(self._finish, key))
+        return future
+
+    def shutdown(self) -> None:
+        """Wait for requests in progress to finish."""
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,73 @@
+"""
+Approximate matching of cache keys.
+
+Cache keys are normalized strings, so a lookup misses the cache if the key
+differs from a cached one in any way, e.g. by a "Remastered" suffix or by
+punctuation. The trigram index finds cached keys similar to a missed one, so
+that they can be offered as candidates before searching MusicBrainz.
+"""
+
+from typing import Dict, Iterable, List, Set, Tuple
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrigramIndex:
+    """
+    In-memory inverted index from character trigrams to keys. Similarity of
+    two keys is the Dice coefficient of their trigram sets, between 0 and 1.
+    """
+
+    def __init__(self, keys: Iterable[str] = ()):
+        self.postings: Dict[str, Set[str]] = {}
+        self.sizes: Dict[str, int] = {}
+
+        for key in keys:
+            self.add(key)
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def add(self, key: str) -> None:
+        """Add the key to the index."""
+        if key in self.sizes:
+            return
+
+        trigrams = _trigrams(key)
+        for trigram in trigrams:
+            self.postings.setdefault(trigram, set()).add(key)
+        self.sizes[key] = len(trigrams)
+
+    def remove(self, key: str) -> None:
+        """Remove the key from the index, if it is there."""
+        if self.sizes.pop(key, None) is None:
+            return
+
+        for trigram in _trigrams(key):
+            keys = self.postings[trigram]
+            keys.discard(key)
+            if not keys:
+                del self.postings[trigram]
+
+    def search(self, key: str, min_score: float, limit: int) -> List[Tuple[str, float]]:
+        """
+        Return at most limit (key, score) pairs of indexed keys whose
+        similarity to the key is at least min_score, best first.
+        """
+        trigrams = _trigrams(key)
+        shared: Dict[str, int] = {}
+        for trigram in trigrams:
+            for candidate in self.postings.get(trigram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+
+        scored = []
+        for candidate, count in shared.items():
+            score = 2 * count / (len(trigrams) + self.sizes[candidate])
+            if score >= min_score:
+                scored.append((candidate, score))
+
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return scored[:limit]
@@ -0,0 +1,669 @@
+"""
+Storage backends for cache indexes.
+
+A cache index maps cache keys to entries, which are small dictionaries holding
+the entity MBID and bookkeeping information. Index backends differ only in how
+the entries are stored on disk:
+
+* `json` keeps the whole index in memory and writes it back as a single JSON
+  file when it has changed. This is the original storage format.
+* `journal` uses the same JSON file as a snapshot, but appends every change
+  to a journal file instead of rewriting the snapshot. The journal is replayed
+  over the snapshot when the index is opened, and folded into the snapshot
+  when it grows large (or when `compact()` is called).
+* `sqlite` keeps the index in an SQLite database in WAL mode. Lookups use the
+  primary key index and updates are written per row, so the cost of opening
+  and closing the cache does not depend on the number of entries.
+* `table` keeps the index in a sorted table of records, which is memory-mapped
+  instead of being read when the index is opened. Lookups use binary search
+  and read only the records they compare against. Changes are kept in memory
+  and the table is rewritten when the index is flushed.
+
+Backends also maintain a reverse mapping from MBIDs to keys, so that entries
+can be found by MBID without scanning the whole index. The JSON backends build
+it in memory on first use and update it incrementally; the SQLite and table
+backends persist it on disk.
+
+Entries returned by backends must be treated as copies: changes are persisted
+only by passing the modified entry back to `put()`.
+
+The backend of a cache is recorded in its directory (see `_resolve_backend()`),
+so that all openers of the cache use the same index files. A cache can move
+from the JSON backends to the others, which import the JSON index when they
+create their own, but not back.
+"""
+
+import json
+import mmap
+import os
+import sqlite3
+import struct
+from typing import Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+
+class _Index:
+    """Base class for cache index storage backends."""
+
+    def __init__(self, cache_dir: str, name: str = 'index', read_only: bool = False):
+        self.cache_dir = cache_dir
+        self.name = name
+        self.read_only = read_only
+        self.created = False
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def __contains__(self, key: object) -> bool:
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return the entry stored under the key, or None."""
+        raise NotImplementedError
+
+    def put(self, key: str, entry: Dict) -> None:
+        """Insert or replace the entry stored under the key."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Remove the entry stored under the key, if it exists."""
+        raise NotImplementedError
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        """Iterate over all (key, entry) pairs in the index."""
+        raise NotImplementedError
+
+    def find_key(self, mbid: str) -> Optional[str]:
+        """Return a key of an entry with the given MBID, or None."""
+        raise NotImplementedError
+
+    def ids(self) -> Set[str]:
+        """Return the set of all MBIDs stored in the index."""
+        return {entry['id'] for _, entry in self.items()}
+
+    def flush(self) -> None:
+        """Write pending changes to disk."""
+        raise NotImplementedError
+
+    def compact(self) -> None:
+        """Reorganize on-disk storage. Does nothing unless overridden."""
+
+    def close(self) -> None:
+        """Write pending changes to disk and release resources."""
+        self.flush()
+
+
+class _JsonIndex(_Index):
+    """Index stored as a single JSON file, loaded into memory as a whole."""
+
+    def __init__(self, cache_dir: str, name: str = 'index', read_only: bool = False):
+        super().__init__(cache_dir, name, read_only)
+        self.path = os.path.join(cache_dir, name + '.json')
+        self.entries: Dict[str, Dict] = {}
+        self.by_id: Optional[Dict[str, Set[str]]] = None
+        self.dirty = False
+
+        try:
+            with open(self.path, encoding='utf-8') as index_file:
+                self.entries = json.load(index_file)
+        except FileNotFoundError:
+            self.created = True
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self.entries
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self.entries.get(key)
+        return None if entry is None else dict(entry)
+
+    def put(self, key: str, entry: Dict) -> None:
+        previous = self.entries.get(key)
+        if previous is not None and previous['id'] == entry['id']:
+            # the reverse index is left alone, so updates do not disturb concurrent readers
+            self.entries[key] = dict(entry)
+        else:
+            self._unlink(key)
+            self.entries[key] = dict(entry)
+            self._link(key)
+        self.dirty = True
+
+    def delete(self, key: str) -> None:
+        self._unlink(key)
+        if self.entries.pop(key, None) is not None:
+            self.dirty = True
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        for key, entry in self.entries.items():
+            yield key, dict(entry)
+
+    def _reverse_index(self) -> Dict[str, Set[str]]:
+        by_id = self.by_id
+        if by_id is None:
+            # built aside, so that concurrent readers never see a partial reverse index
+            by_id = {}
+            for key, entry in self.entries.items():
+                by_id.setdefault(entry['id'], set()).add(key)
+            self.by_id = by_id
+
+        return by_id
+
+    def _link(self, key: str) -> None:
+        if self.by_id is not None:
+            self.by_id.setdefault(self.entries[key]['id'], set()).add(key)
+
+    def _unlink(self, key: str) -> None:
+        if self.by_id is None or key not in self.entries:
+            return
+
+        mbid = self.entries[key]['id']
+        keys = self.by_id[mbid]
+        keys.discard(key)
+        if not keys:
+            del self.by_id[mbid]
+
+    def find_key(self, mbid: str) -> Optional[str]:
+        keys = self._reverse_index().get(mbid)
+        return None if not keys else min(keys)
+
+    def ids(self) -> Set[str]:
+        return set(self._reverse_index().keys())
+
+    def flush(self) -> None:
+        if not self.dirty:
+            return
+
+        # write to a temporary file first, so that the index is never left
+        # truncated if the process is interrupted while writing.
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as index_file:
+            json.dump(self.entries, index_file, indent=1, sort_keys=True)
+        os.replace(temp_path, self.path)
+        self.dirty = False
+
+
+class _JournalIndex(_JsonIndex):
+    """
+    JSON index with an append-only journal of changes.
+
+    Each change is appended to the journal as one JSON line, so the cost of a
+    write depends on the size of the change rather than the size of the index.
+    If the process is interrupted, at most the last (partially written) journal
+    record is lost. The journal is compacted into the snapshot on close once it
+    holds more than compact_ratio records per index entry (but not fewer than
+    min_compact records), unless the index was opened read-only.
+    """
+
+    min_compact = 1000
+    compact_ratio = 0.25
+
+    def __init__(self, cache_dir: str, name: str = 'index', read_only: bool = False):
+        super().__init__(cache_dir, name, read_only)
+        self.journal_path = os.path.join(cache_dir, name + '.journal')
+        self.journal: Optional[TextIO] = None
+        self.records = self._replay()
+
+        if self.records > 0:
+            self.created = False
+
+    def _replay(self) -> int:
+        records = 0
+        valid_size = 0
+
+        try:
+            with open(self.journal_path, 'rb' if self.read_only else 'r+b') as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line) if line.endswith(b'\n') else None
+                    except ValueError:
+                        record = None
+
+                    if record is None:
+                        # the last record may be truncated by an interrupted
+                        # write: drop it, so that new records are not appended
+                        # to a broken line (a read-only index leaves the repair
+                        # to the next writer).
+                        if not self.read_only:
+                            journal.truncate(valid_size)
+                        break
+
+                    if 'e' in record:
+                        self.entries[record['k']] = record['e']
+                    else:
+                        self.entries.pop(record['k'], None)
+                    records += 1
+                    valid_size += len(line)
+        except FileNotFoundError:
+            pass
+
+        return records
+
+    def _append(self, record: Dict) -> None:
+        if self.journal is None:
+            # pylint: disable=consider-using-with
+            self.journal = open(self.journal_path, 'a', encoding='utf-8')
+
+        self.journal.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.journal.flush()
+        self.records += 1
+
+    def put(self, key: str, entry: Dict) -> None:
+        super().put(key, entry)
+        self._append({'k': key, 'e': entry})
+
+    def delete(self, key: str) -> None:
+        if key in self.entries:
+            super().delete(key)
+            self._append({'k': key})
+
+    def flush(self) -> None:
+        if self.journal is not None:
+            self.journal.flush()
+
+    def compact(self) -> None:
+        """Write the whole index to the snapshot file and empty the journal."""
+        if self.records == 0:
+            return
+
+        self.dirty = True
+        super().flush()
+
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+        os.remove(self.journal_path)
+        self.records = 0
+
+    def close(self) -> None:
+        threshold = max(self.min_compact, self.compact_ratio * len(self.entries))
+
+        if not self.read_only and self.records > threshold:
+            self.compact()
+        elif self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+
+class _SqliteIndex(_Index):
+    """
+    Index stored in an SQLite database in WAL mode.
+
+    If the database does not exist yet but a JSON index does, the entries are
+    imported from it (and its journal, if present) once. The JSON files are
+    left in place, but they are no longer updated. A read-only index which
+    does not exist is kept in memory instead of being created.
+    """
+
+    def __init__(self, cache_dir: str, name: str = 'index', read_only: bool = False):
+        super().__init__(cache_dir, name, read_only)
+        self.path = os.path.join(cache_dir, name + '.sqlite')
+        exists = os.path.exists(self.path)
+
+        # the cache serializes writes, but reads may come from any thread
+        self.conn = sqlite3.connect(self.path if exists or not read_only else ':memory:',
+                                    check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS entries '
+                          '(key TEXT PRIMARY KEY, id TEXT NOT NULL, entry TEXT NOT NULL)')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS entries_by_id ON entries (id)')
+        self.conn.commit()
+
+        if not exists:
+            self.created = not self._migrate_from_json()
+
+    def _migrate_from_json(self) -> bool:
+        source = _JournalIndex(self.cache_dir, self.name, read_only=True)
+
+        if not source.created:
+            with self.conn:
+                self.conn.executemany('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                                      ((key, entry['id'], json.dumps(entry))
+                                       for key, entry in source.items()))
+            print('Migrated', len(source), 'entries from', source.path)
+
+        source.close()
+        return not source.created
+
+    def __len__(self) -> int:
+        return self.conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def __contains__(self, key: object) -> bool:
+        row = self.conn.execute('SELECT 1 FROM entries WHERE key = ?', (key, )).fetchone()
+        return row is not None
+
+    def get(self, key: str) -> Optional[Dict]:
+        row = self.conn.execute('SELECT entry FROM entries WHERE key = ?', (key, )).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, key: str, entry: Dict) -> None:
+        self.conn.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?)',
+                          (key, entry['id'], json.dumps(entry)))
+
+    def delete(self, key: str) -> None:
+        self.conn.execute('DELETE FROM entries WHERE key = ?', (key, ))
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        rows = self.conn.execute('SELECT key, entry FROM entries ORDER BY key').fetchall()
+        for key, entry in rows:
+            yield key, json.loads(entry)
+
+    def find_key(self, mbid: str) -> Optional[str]:
+        row = self.conn.execute('SELECT MIN(key) FROM entries WHERE id = ?', (mbid, )).fetchone()
+        return row[0]
+
+    def ids(self) -> Set[str]:
+        return {row[0] for row in self.conn.execute('SELECT DISTINCT id FROM entries')}
+
+    def flush(self) -> None:
+        self.conn.commit()
+
+    def compact(self) -> None:
+        """Rebuild the database file and truncate the write-ahead log."""
+        self.conn.commit()
+        self.conn.execute('VACUUM')
+        self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+    def close(self) -> None:
+        self.flush()
+        self.conn.close()
+
+
+class _TableIndex(_Index):
+    """
+    Index stored in a sorted, memory-mapped table.
+
+    The table file starts with a header holding the number of records, which
+    is followed by two arrays of record offsets: one sorted by key and one
+    sorted by MBID. Each record holds the key, the MBID and the JSON-encoded
+    entry, separated by NUL bytes and terminated by a newline.
+
+    Opening the index maps the file without reading it, and each lookup reads
+    only the records visited by binary search. Changes are kept in an overlay
+    and merged into a new table when the index is flushed, so writing costs
+    time proportional to the size of the whole index. If the table does not
+    exist, it is created from the JSON index (and its journal, if present).
+    """
+
+    header = struct.Struct('<4sII')
+    magic = b'MBCT'
+    version = 1
+
+    def __init__(self, cache_dir: str, name: str = 'index', read_only: bool = False):
+        super().__init__(cache_dir, name, read_only)
+        self.path = os.path.join(cache_dir, name + '.table')
+        self.table: Optional[mmap.mmap] = None
+        self.count = 0
+        # pending changes; None marks a deleted entry
+        self.overlay: Dict[str, Optional[Dict]] = {}
+        self.length = 0
+
+        if not os.path.exists(self.path):
+            self._migrate_from_json()
+
+        self._map()
+        self.length = self.count
+
+    def _migrate_from_json(self) -> None:
+        source = _JournalIndex(self.cache_dir, self.name, read_only=True)
+        self.created = source.created
+
+        if not source.created:
+            records = [(key.encode('utf-8'), entry['id'].encode('ascii'),
+                        json.dumps(entry).encode('ascii')) for key, entry in source.items()]
+            self._write(sorted(records))
+            print('Migrated', len(source), 'entries from', source.path)
+
+        source.close()
+
+    def _map(self) -> None:
+        if self.table is not None:
+            self.table.close()
+            self.table = None
+        self.count = 0
+
+        try:
+            with open(self.path, 'rb') as table_file:
+                if os.fstat(table_file.fileno()).st_size == 0:
+                    return
+                self.table = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return
+
+        magic, version, self.count = self.header.unpack_from(self.table, 0)
+        if magic != self.magic or version != self.version:
+            raise ValueError(f'{self.path} is not a valid index table')
+
+    def _write(self, records: List[Tuple[bytes, bytes, bytes]]) -> None:
+        """Write a new table from records sorted by key."""
+        count = len(records)
+        data_start = self.header.size + 16 * count
+        offsets = []
+        position = data_start
+
+        for key, mbid, entry in records:
+            offsets.append(position)
+            position += len(key) + len(mbid) + len(entry) + 3
+
+        by_id = sorted(range(count), key=lambda i: (records[i][1], records[i][0]))
+
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as table_file:
+            table_file.write(self.header.pack(self.magic, self.version, count))
+            table_file.write(struct.pack(f'<{count}Q', *offsets))
+            table_file.write(struct.pack(f'<{count}Q', *(offsets[i] for i in by_id)))
+            for key, mbid, entry in records:
+                table_file.write(b'%s\0%s\0%s\n' % (key, mbid, entry))
+        os.replace(temp_path, self.path)
+
+    def _offset(self, array: int, position: int) -> int:
+        assert self.table is not None, 'table is None'
+        start = self.header.size + 8 * (array * self.count + position)
+        return struct.unpack_from('<Q', self.table, start)[0]
+
+    def _record(self, offset: int) -> Tuple[bytes, bytes, int, int]:
+        """Return key, MBID and the bounds of the entry of a record."""
+        assert self.table is not None, 'table is None'
+        key_end = self.table.find(b'\0', offset)
+        id_end = self.table.find(b'\0', key_end + 1)
+        entry_end = self.table.find(b'\n', id_end + 1)
+        return (self.table[offset:key_end], self.table[key_end + 1:id_end], id_end + 1, entry_end)
+
+    def _field(self, offset: int, field: int) -> bytes:
+        """Return the key (field 0) or the MBID (field 1) of a record."""
+        key, mbid, _, _ = self._record(offset)
+        return mbid if field else key
+
+    def _bisect(self, array: int, field: int, value: bytes) -> int:
+        """Return the first position in the array whose field is not less than value."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._field(self._offset(array, middle), field) < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _table_get(self, key: str) -> Optional[Dict]:
+        if self.table is None:
+            return None
+
+        encoded = key.encode('utf-8')
+        position = self._bisect(0, 0, encoded)
+        if position == self.count:
+            return None
+
+        record_key, _, start, end = self._record(self._offset(0, position))
+        if record_key != encoded:
+            return None
+
+        return json.loads(self.table[start:end])
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self.get(key) is not None
+
+    def get(self, key: str) -> Optional[Dict]:
+        if key in self.overlay:
+            entry = self.overlay[key]
+            return None if entry is None else dict(entry)
+
+        return self._table_get(key)
+
+    def put(self, key: str, entry: Dict) -> None:
+        if key not in self:
+            self.length += 1
+        self.overlay[key] = dict(entry)
+
+    def delete(self, key: str) -> None:
+        if key in self:
+            self.length -= 1
+            self.overlay[key] = None
+
+    def _table_items(self) -> Iterator[Tuple[str, Dict]]:
+        for position in range(self.count):
+            key, _, start, end = self._record(self._offset(0, position))
+            assert self.table is not None, 'table is None'
+            yield key.decode('utf-8'), json.loads(self.table[start:end])
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        for key, entry in self._table_items():
+            if key not in self.overlay:
+                yield key, entry
+
+        for key, pending in list(self.overlay.items()):
+            if pending is not None:
+                yield key, dict(pending)
+
+    def find_key(self, mbid: str) -> Optional[str]:
+        candidates = [
+            key for key, entry in list(self.overlay.items())
+            if entry is not None and entry['id'] == mbid
+        ]
+
+        if self.table is not None:
+            encoded = mbid.encode('ascii')
+            position = self._bisect(1, 1, encoded)
+            while position < self.count:
+                key, record_id, _, _ = self._record(self._offset(1, position))
+                if record_id != encoded:
+                    break
+                if key.decode('utf-8') not in self.overlay:
+                    candidates.append(key.decode('utf-8'))
+                    break
+                position += 1
+
+        return min(candidates) if candidates else None
+
+    def flush(self) -> None:
+        if not self.overlay:
+            return
+
+        merged: Dict[bytes, Tuple[bytes, bytes]] = {}
+        for position in range(self.count):
+            record_key, mbid, start, end = self._record(self._offset(0, position))
+            assert self.table is not None, 'table is None'
+            merged[record_key] = (mbid, self.table[start:end])
+
+        for key, pending in self.overlay.items():
+            encoded = key.encode('utf-8')
+            if pending is None:
+                merged.pop(encoded, None)
+            else:
+                merged[encoded] = (pending['id'].encode('ascii'),
+                                   json.dumps(pending).encode('ascii'))
+
+        self._write(sorted((key, mbid, entry) for key, (mbid, entry) in merged.items()))
+        self.overlay = {}
+        self._map()
+        self.length = self.count
+
+    def close(self) -> None:
+        self.flush()
+        if self.table is not None:
+            self.table.close()
+            self.table = None
+
+
+_BACKENDS = {
+    'json': _JsonIndex,
+    'journal': _JournalIndex,
+    'sqlite': _SqliteIndex,
+    'table': _TableIndex,
+}
+
+# backends which import an index written by another backend when they create their own
+_MIGRATIONS = {
+    'journal': {'json'},
+    'sqlite': {'json', 'journal'},
+    'table': {'json', 'journal'},
+}
+
+# index files identifying the backend of a cache created before backends were recorded
+_BACKEND_FILES = (('sqlite', 'index.sqlite'), ('table', 'index.table'),
+                  ('journal', 'index.journal'), ('json', 'index.json'))
+
+
+def _detect_backend(cache_dir: str) -> Optional[str]:
+    for backend, file_name in _BACKEND_FILES:
+        if os.path.exists(os.path.join(cache_dir, file_name)):
+            return backend
+
+    return None
+
+
+def _resolve_backend(cache_dir: str, backend: Optional[str], read_only: bool = False) -> str:
+    """
+    Return the index backend of the cache in the directory. If backend is
+    None, the recorded backend of the cache is used (or the backend detected
+    from the index files, or 'json' for a new cache). A different backend is
+    accepted only if it can import the index of the cache and the cache is
+    not read-only. Otherwise ValueError is raised. Unless the cache is
+    read-only, the backend is recorded in the directory.
+    """
+    marker_path = os.path.join(cache_dir, 'index.backend')
+    try:
+        with open(marker_path, encoding='utf-8') as marker:
+            recorded: Optional[str] = marker.read().strip()
+    except FileNotFoundError:
+        recorded = _detect_backend(cache_dir)
+
+    if backend is None:
+        backend = recorded or 'json'
+
+    if backend not in _BACKENDS:
+        raise ValueError(f'unknown index backend: {backend}')
+
+    if recorded is not None and backend != recorded:
+        if read_only or recorded not in _MIGRATIONS.get(backend, set()):
+            raise ValueError(f'cache in {cache_dir} uses the {recorded} index backend, '
+                             f'which cannot be opened as {backend}')
+
+    if not read_only and (recorded != backend or not os.path.exists(marker_path)):
+        temp_path = marker_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as marker:
+            marker.write(backend + '\n')
+        os.replace(temp_path, marker_path)
+
+    return backend
+
+
+def _open_index(backend: str,
+                cache_dir: str,
+                name: str = 'index',
+                read_only: bool = False) -> _Index:
+    """
+    Open a cache index using the named storage backend. A read-only index is
+    not modified on disk unless it is explicitly written to.
+    """
+    try:
+        index_class = _BACKENDS[backend]
+    except KeyError as exc:
+        raise ValueError(f'unknown index backend: {backend}') from exc
+
+    return index_class(cache_dir, name, read_only)
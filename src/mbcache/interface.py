@@ -4,39 +4,232 @@ The included classes manage searching for entities in MusicBrainz, displaying
 search results to users, and handling storage and retrieval operations via
 low-level cache objects.
 
-The caches are protected against concurrent access by different processes, but
-not by multiple threads within one process. It is the responsibility of the
-user to ensure thread-level synchronization.
+The caches are protected against concurrent access by different processes, and
+a cache object can be shared by many threads within one process: lookups run
+in parallel, and only changes to the cache are serialized. Caches opened in
+read-only mode can be used by many processes at the same time.
 """
 
-from typing import Dict, Optional
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Type, Union
 
 import musicbrainzngs
 
-from mbcache.cache import _RecordingCache, _ReleaseCache
-from mbcache.params import _RecordingParams, _ReleaseParams
+from mbcache.cache import _Cache, _RecordingCache, _ReleaseCache
+from mbcache.fetch import _Fetcher, _TokenBucket
+from mbcache.metrics import _Metrics
+from mbcache.params import _EntityParams, _RecordingParams, _ReleaseParams
+from mbcache.remote import _default_socket_path, _RemoteCache
+from mbcache.selection import DEFERRED, InteractiveSelection, SelectionPolicy
 from mbcache.version import APPNAME, URL, VERSION
 
 
-# pylint: disable=too-few-public-methods
 class _MbCache:
-    """Base class for entity-specific high-level cache objects."""
+    """
+    Base class for entity-specific high-level cache objects.
+
+    When a search returns more than one result, the selection policy decides
+    which one to use (see mbcache.selection). By default the user is asked.
+
+    Batch operations send requests to MusicBrainz from fetch_workers threads.
+    All requests of the cache, batched or not, are sent at a rate of at most
+    request_rate requests per second. The rate limit of musicbrainzngs (one
+    request per second by default) applies as well, unless the application
+    changes it with musicbrainzngs.set_rate_limit(). The hostname (and
+    use_https) options select a different MusicBrainz web service server.
+    Remaining keyword options are passed to the low-level cache. Among them,
+    negative_ttl enables caching of failed searches and lookups: they are not
+    repeated until negative_ttl seconds have passed. Searches whose selection
+    is deferred by the selection policy are not cached.
+
+    If daemon is True (or the path of a socket), the cache is not opened by
+    this object, but used through a cache daemon (see mbcache.daemon) which
+    serves the cache of the same name. The low-level cache options are then
+    set by the daemon, and the application name is not used.
+
+    If fuzzy_score is set, a search which misses the cache is first matched
+    approximately against cached entries (see mbcache.fuzzy). Entries with
+    similarity of at least fuzzy_score (between 0 and 1) are offered to the
+    selection policy as if they were search results, scored from 0 to 100.
+    The selected entry is stored under the missed key as well, so the policy
+    is asked to confirm even a single entry (see SelectionPolicy.confirming()).
+    MusicBrainz is searched only if no entry is selected.
+
+    Cache hits and misses, and timings of cache and MusicBrainz operations
+    are available from metrics() (see mbcache.metrics). If metrics_file is
+    set, the metrics are also appended to this file as a JSON line when the
+    cache is closed. Metrics of a cache used through a daemon do not cover
+    the daemon's own operations.
+    """
 
-    def __init__(self):
+    # pylint: disable=too-many-arguments
+    def __init__(self,
+                 cache_class: Type[_Cache],
+                 application: str,
+                 cache_name: str,
+                 fetch_workers: int = 4,
+                 request_rate: float = 1.0,
+                 hostname: Optional[str] = None,
+                 use_https: bool = False,
+                 selection: Optional[SelectionPolicy] = None,
+                 daemon: Union[bool, str] = False,
+                 metrics_file: Optional[str] = None,
+                 fuzzy_score: Optional[float] = None,
+                 **options):
         musicbrainzngs.set_useragent(APPNAME, VERSION, URL)
+        if hostname is not None:
+            musicbrainzngs.set_hostname(hostname, use_https)
+
+        self._selection = selection if selection is not None else InteractiveSelection()
+        self._fetch_workers = fetch_workers
+        self._bucket = _TokenBucket(request_rate)
+        self._fetcher: Optional[_Fetcher] = None
+        self._lock = threading.Lock()
+        self._cache_name = cache_name
+        self._metrics = _Metrics()
+        self._metrics_file = metrics_file
+        self._fuzzy_score = fuzzy_score
+
+        self._cache: Union[_Cache, _RemoteCache]
+        if daemon:
+            socket_path = daemon if isinstance(daemon, str) else _default_socket_path()
+            self._cache = _RemoteCache(socket_path, cache_name)
+        else:
+            self._cache = cache_class(application, cache_name, metrics=self._metrics, **options)
+
+    def _get_fetcher(self) -> _Fetcher:
+        with self._lock:
+            if self._fetcher is None:
+                self._fetcher = _Fetcher(self._fetch_workers)
+            return self._fetcher
+
+    def _request(self, timer: str, function: Callable, *args, **kwargs) -> Any:
+        """
+        Call a musicbrainzngs function when the rate limit allows it. The
+        wait for the rate limit and the call are added to separate timers.
+        """
+        with self._metrics.timer('network.wait'):
+            self._bucket.acquire()
+
+        with self._metrics.timer(timer):
+            return function(*args, **kwargs)
+
+    # names of search result fields corresponding to the fields of a cache key
+    _key_fields: Tuple[str, ...] = ()
+
+    def _describe_key(self, key: str) -> Dict:
+        """Return a search result-like description of the cache key."""
+        fields = key.split('\t')
+        if len(fields) < 2:
+            # normalization may not preserve field separators
+            return {'artist-credit-phrase': '', 'title': key}
+
+        return dict(zip(self._key_fields, fields))
+
+    def _fuzzy_lookup(self, params: _EntityParams, query: Dict) -> Optional[str]:
+        """
+        Offer cached entries similar to the entity parameters to the selection
+        policy. Return the MBID of the selected entry, or None.
+        """
+        if self._fuzzy_score is None:
+            return None
+
+        similar = self._cache.similar(params, self._fuzzy_score)
+        if not similar:
+            return None
+
+        results = [{
+            'id': mbid,
+            'ext:score': str(round(score * 100)),
+            **self._describe_key(key)
+        } for key, mbid, score in similar]
+
+        print(f'Found {len(results)} similar cached entries:')
+        for idx, (key, _, _) in enumerate(similar):
+            print('[%d]\tscore = %s\t%s' %
+                  (idx + 1, results[idx]['ext:score'], key.replace('\t', ' - ')))
+
+        index = self._selection.confirming().select(results, query)
+        if index is None or index == DEFERRED:
+            return None
+
+        key, mbid, _ = similar[index]
+        self._cache.alias(params, key)
+        self._metrics.count('lookup.fuzzy')
+        return mbid
+
+    def metrics(self) -> Dict:
+        """
+        Return the counters and timing histograms collected so far, as
+        a JSON-serializable dictionary.
+        """
+        return self._metrics.snapshot()
+
+    def add_metrics_hook(self, hook: Callable[[str, float], None]) -> None:
+        """Call hook(name, value) for every counted or timed event from now on."""
+        self._metrics.add_hook(hook)
+
+    def _emit_metrics(self) -> None:
+        if self._metrics_file is None:
+            return
+
+        record = {'time': int(time.time()), 'cache': self._cache_name, **self.metrics()}
+        with open(self._metrics_file, 'a', encoding='utf-8') as metrics_file:
+            metrics_file.write(json.dumps(record) + '\n')
+
+    def close(self) -> None:
+        """Wait for pending MusicBrainz requests and close the cache."""
+        if self._fetcher is not None:
+            self._fetcher.shutdown()
+            self._fetcher = None
+
+        self._cache.close()
+        self._emit_metrics()
 
 
-# pylint: disable=too-few-public-methods
 class MbRecordingCache(_MbCache):
     """
     High-level cache object for MusicBrainz recording MBIDs. Manages searching
     for recording MBIDs in MusicBrainz, presenting search results to the user,
     storing results in the low-level cache, and retrieving them as needed.
+
+    Keyword options are passed to the low-level cache. The backend option
+    selects the index storage format: 'json', 'journal', 'sqlite' or 'table'.
+    By default an existing cache is opened with the backend recorded in it,
+    and a new one with 'json'. If read_only is True, the cache is opened with a shared lock,
+    so it can be used by many processes at the same time.
+
+    If releases is set to a release cache opened with track_index=True,
+    recordings missing from the cache are looked up in the tracklists of
+    cached releases before searching MusicBrainz (see
+    MbReleaseCache.find_recording()). Recordings found there are stored in
+    the cache.
     """
 
-    def __init__(self, application: str = APPNAME, cache_name: str = 'recordings'):
-        self._cache = _RecordingCache(application, cache_name)
-        super().__init__()
+    _key_fields = ('artist-credit-phrase', 'album', 'title')
+    _cache: Union[_RecordingCache, _RemoteCache]
+
+    def __init__(self,
+                 application: str = APPNAME,
+                 cache_name: str = 'recordings',
+                 releases: Optional['MbReleaseCache'] = None,
+                 **options):
+        super().__init__(_RecordingCache, application, cache_name, **options)
+        self._releases = releases
+
+    def _lookup(self, params: _RecordingParams) -> Optional[str]:
+        mbid = self._cache.lookup(params)
+        if mbid is not None or self._releases is None:
+            return mbid
+
+        mbid = self._releases.find_recording(params.artist, params.title, params.album)
+        if mbid is not None:
+            self._cache.store(mbid, params)
+
+        return mbid
 
     @staticmethod
     def _print_search_results(recordings: Dict) -> None:
@@ -68,57 +261,116 @@ class MbRecordingCache(_MbCache):
             print('[%d]\tscore = %s\t(%d releases, %d ISRCs)\t%s - "%s"%s' %
                   (idx + 1, score, albums, isrcs, artist, title, disambiguation))
 
-    @staticmethod
-    def _select_from_search_results(recordings: Dict) -> Optional[str]:
-        count = recordings['recording-count']
-
-        if count == 1:
-            return recordings['recording-list'][0]['id']
+    def _select_from_search_results(self, recordings: Dict,
+                                    query: Dict) -> Tuple[Optional[str], bool]:
+        results = recordings['recording-list']
+        index = self._selection.select(results, query)
 
-        while True:
-            index = int(input(f'Which one to use? (0 - none of these) [0-{count}] '))
+        if index is None or index == DEFERRED:
+            return None, index is None
 
-            if index == 0:
-                print('Search result discarded.')
-                return None
+        return results[index]['id'], False
 
-            if 1 <= index <= count:
-                return recordings['recording-list'][index - 1]['id']
+    def _query_musicbrainz(self, artist: str, title: str, album: str) -> Dict:
+        return self._request('network.search',
+                             musicbrainzngs.search_recordings,
+                             artist=artist,
+                             recordingaccent=title,
+                             release=album,
+                             video=False,
+                             strict=True)
 
-    @staticmethod
-    def _search_in_musicbrainz(artist: str, title: str, album: str) -> Optional[str]:
-        recordings = musicbrainzngs.search_recordings(artist=artist,
-                                                      recordingaccent=title,
-                                                      release=album,
-                                                      video=False,
-                                                      strict=True)
-
-        MbRecordingCache._print_search_results(recordings)
+    def _choose_from_search_results(self, recordings: Dict,
+                                    query: Dict) -> Tuple[Optional[str], bool]:
+        """
+        Return the selected recording MBID, or None and whether no recording
+        should be used (the search returned no results or they were all
+        discarded), as opposed to the selection being deferred.
+        """
+        self._print_search_results(recordings)
 
         if recordings['recording-count'] == 0:
-            return None
+            return None, True
 
-        return MbRecordingCache._select_from_search_results(recordings)
+        return self._select_from_search_results(recordings, query)
+
+    def _search_in_musicbrainz(self, artist: str, title: str,
+                               album: str) -> Tuple[Optional[str], bool]:
+        recordings = self._query_musicbrainz(artist, title, album)
+        query = {'artist': artist, 'title': title, 'album': album}
+        return self._choose_from_search_results(recordings, query)
 
     def get(self, artist: str, title: str, album: str) -> Optional[str]:
         """
         Retrieve a recording from the cache using the specified artist, title,
         and album information. If the recording is not found in the cache,
         search for it in MusicBrainz and add it to the cache for future use.
-        If the search result is ambiguous, present the choices to the user
-        and ask them to select the best-matching recording.
+        If the search result is ambiguous, the selection policy decides which
+        recording to use (by default the user is asked to select the
+        best-matching recording).
         """
         params = _RecordingParams(artist, title, album)
 
-        mbid = self._cache.lookup(params)
+        mbid = self._lookup(params)
+        if mbid is not None or self._cache.is_negative(params.key()):
+            return mbid
+
+        mbid = self._fuzzy_lookup(params, {'artist': artist, 'title': title, 'album': album})
         if mbid is not None:
             return mbid
 
-        mbid = self._search_in_musicbrainz(artist, title, album)
+        mbid, not_found = self._search_in_musicbrainz(artist, title, album)
+        self._store_search_result(mbid, not_found, params)
+        return mbid
+
+    def _store_search_result(self, mbid: Optional[str], not_found: bool,
+                             params: _RecordingParams) -> None:
         if mbid is not None:
             self._cache.store(mbid, params)
+        elif not_found:
+            self._cache.store_negative(params.key())
 
-        return mbid
+    def get_many(self, recordings: Iterable[Tuple[str, str, str]]) -> List[Optional[str]]:
+        """
+        Retrieve many recordings, each specified by an (artist, title, album)
+        tuple. All cache hits are resolved first, then each distinct missing
+        recording is searched for in MusicBrainz once. The searches are run
+        concurrently, and their results are presented for selection one by
+        one, as in get(). Return the recording MBIDs (or None) in the order of
+        the input tuples.
+        """
+        queries = [_RecordingParams(artist, title, album) for artist, title, album in recordings]
+        keys = [params.key() for params in queries]
+        found: Dict[str, Optional[str]] = {}
+        missing: Dict[str, _RecordingParams] = {}
+
+        for key, params in zip(keys, queries):
+            if key in found or key in missing:
+                continue
+
+            mbid = self._lookup(params)
+            if mbid is None and not self._cache.is_negative(key):
+                query = {'artist': params.artist, 'title': params.title, 'album': params.album}
+                mbid = self._fuzzy_lookup(params, query)
+
+            if mbid is None and not self._cache.is_negative(key):
+                missing[key] = params
+            else:
+                found[key] = mbid
+
+        fetcher = self._get_fetcher()
+        searches = {}
+        for key, params in missing.items():
+            searches[key] = fetcher.submit(('recording', key), self._query_musicbrainz,
+                                           params.artist, params.title, params.album)
+
+        for key, params in missing.items():
+            query = {'artist': params.artist, 'title': params.title, 'album': params.album}
+            mbid, not_found = self._choose_from_search_results(searches[key].result(), query)
+            self._store_search_result(mbid, not_found, params)
+            found[key] = mbid
+
+        return [found[key] for key in keys]
 
 
 class MbReleaseCache(_MbCache):
@@ -127,11 +379,69 @@ class MbReleaseCache(_MbCache):
     releases in MusicBrainz, presenting search results to the user, storing
     the results in the low-level cache, and retrieving them by artist and
     title, or by release MBID.
+
+    Keyword options are passed to the low-level cache. The backend option
+    selects the index storage format: 'json', 'journal', 'sqlite' or 'table'.
+    By default an existing cache is opened with the backend recorded in it,
+    and a new one with 'json'. If read_only is True, the cache is opened with a shared lock,
+    so it can be used by many processes at the same time.
+
+    If the lru_entries option is set, decoded releases are kept in memory
+    (see mbcache.cache), and releases returned by get(), get_mbid() and
+    get_many() are shared between calls: they must not be modified.
+
+    If the max_age option is set, releases older than max_age seconds (unless
+    marked as permanent) are returned from the cache as usual, but are also
+    fetched again from MusicBrainz in the background and replaced in the
+    cache when the new data arrives.
     """
 
-    def __init__(self, application: str = APPNAME, cache_name: str = 'releases'):
-        self._cache = _ReleaseCache(application, cache_name)
-        super().__init__()
+    _key_fields = ('artist-credit-phrase', 'title', 'disambiguation')
+    _cache: Union[_ReleaseCache, _RemoteCache]
+
+    def __init__(self, application: str = APPNAME, cache_name: str = 'releases', **options):
+        super().__init__(_ReleaseCache, application, cache_name, **options)
+        self._refreshing: Dict[str, Tuple[str, Future]] = {}
+
+    def _revalidate(self) -> None:
+        """
+        Store the results of finished background refreshes, and start
+        refreshing stale releases returned by recent lookups.
+        """
+        stale = self._cache.take_stale()
+        fetcher = self._get_fetcher() if stale else None
+
+        with self._lock:
+            for mbid, key in stale.items():
+                if mbid not in self._refreshing:
+                    assert fetcher is not None, 'fetcher is None'
+                    future = fetcher.submit(('release', mbid), self._lookup_in_musicbrainz, mbid)
+                    self._refreshing[mbid] = (key, future)
+
+            finished = [(mbid, key, future) for mbid, (key, future) in self._refreshing.items()
+                        if future.done()]
+            for mbid, _, _ in finished:
+                del self._refreshing[mbid]
+
+        for mbid, key, future in finished:
+            try:
+                release, _ = future.result()
+            except musicbrainzngs.WebServiceError as exc:
+                print(f'Failed to refresh release MBID {mbid}: {exc}')
+                continue
+
+            if release is not None:
+                self._cache.refresh(key, release)
+
+    def close(self) -> None:
+        """Wait for pending MusicBrainz requests and refreshes, and close the cache."""
+        if self._fetcher is not None:
+            self._fetcher.shutdown()
+            self._revalidate()
+            self._fetcher = None
+
+        self._cache.close()
+        self._emit_metrics()
 
     @staticmethod
     def _print_search_results(releases: Dict) -> None:
@@ -186,79 +496,118 @@ class MbReleaseCache(_MbCache):
             print('[%d]\tscore = %s\t%s - "%s" (%s)%s' %
                   (idx + 1, score, artist, title, ', '.join(not_empty), disambiguation))
 
-    @staticmethod
-    def _select_from_search_results(releases: Dict) -> Optional[Dict]:
-        count = releases['release-count']
-
-        if count == 1:
-            return releases['release-list'][0]
+    def _select_from_search_results(self, releases: Dict,
+                                    query: Dict) -> Tuple[Optional[Dict], bool]:
+        results = releases['release-list']
+        index = self._selection.select(results, query)
 
-        while True:
-            index = int(input(f'Which one to use? (0 - none of these) [0-{count}] '))
+        if index is None or index == DEFERRED:
+            return None, index is None
 
-            if index == 0:
-                print('Search result discarded.')
-                return None
+        return results[index], False
 
-            if 1 <= index <= count:
-                return releases['release-list'][index - 1]
-
-    @staticmethod
-    def _search_in_musicbrainz(artist: str, title: str) -> Optional[Dict]:
-        releases = musicbrainzngs.search_releases(artist=artist, releaseaccent=title, strict=True)
-        MbReleaseCache._print_search_results(releases)
+    def _search_in_musicbrainz(self, artist: str, title: str) -> Tuple[Optional[Dict], bool]:
+        """
+        Return the selected release, or None and whether no release should be
+        used (the search returned no results or they were all discarded), as
+        opposed to the selection being deferred or the lookup failing.
+        """
+        releases = self._request('network.search',
+                                 musicbrainzngs.search_releases,
+                                 artist=artist,
+                                 releaseaccent=title,
+                                 strict=True)
+        self._print_search_results(releases)
 
         if releases['release-count'] == 0:
-            return None
+            return None, True
 
-        selected = MbReleaseCache._select_from_search_results(releases)
+        selected, not_found = self._select_from_search_results(releases, {
+            'artist': artist,
+            'title': title
+        })
 
         if selected is None:
-            return None
+            return None, not_found
 
         try:
-            result = musicbrainzngs.get_release_by_id(
-                selected['id'], includes=['artists', 'recordings', 'artist-credits'])
-            return result['release']
+            result = self._request('network.lookup',
+                                   musicbrainzngs.get_release_by_id,
+                                   selected['id'],
+                                   includes=['artists', 'recordings', 'artist-credits'])
+            return result['release'], False
         except musicbrainzngs.ResponseError as exc:
             print(f'Failed to look up release MBID {selected["id"]}: {exc}')
-            return None
+            return None, False
 
-    @staticmethod
-    def _lookup_in_musicbrainz(album_mbid: str) -> Optional[Dict]:
+    def _lookup_in_musicbrainz(self, album_mbid: str) -> Tuple[Optional[Dict], bool]:
+        """
+        Return the release, or None and whether the failure is permanent
+        (MusicBrainz reported that the release does not exist).
+        """
         try:
-            result = musicbrainzngs.get_release_by_id(
-                album_mbid, includes=['artists', 'recordings', 'artist-credits'])
+            result = self._request('network.lookup',
+                                   musicbrainzngs.get_release_by_id,
+                                   album_mbid,
+                                   includes=['artists', 'recordings', 'artist-credits'])
         except musicbrainzngs.ResponseError as exc:
             print(f'Failed to look up release MBID {album_mbid}: {exc}')
-            return None
+            return None, getattr(exc.cause, 'code', None) in (400, 404)
 
         try:
-            return result['release']
+            return result['release'], False
         except KeyError:
             print(f'Query for MBID {album_mbid} returned empty result!')
-            return None
+            return None, True
+
+    def _store_lookup_result(self, mbid: str, lookup: Tuple[Optional[Dict], bool],
+                             disambiguation: Optional[str]) -> Optional[Dict]:
+        release, not_found = lookup
+
+        if release is not None:
+            params = _ReleaseParams(release['artist-credit-phrase'], release['title'],
+                                    disambiguation)
+            self._cache.store(release, params)
+        elif not_found:
+            self._cache.store_negative(mbid)
+
+        return release
 
     def get(self, artist: str, title: str, disambiguation: Optional[str] = None) -> Optional[Dict]:
         """
         Retrieve a release from the cache using the specified artist, title,
         and an optional disambiguation string. If the release is not found in
         the cache, search for it in MusicBrainz and add it to the cache for
-        future use. If the search result is ambiguous, present the choices to
-        the user and ask them to select the best-matching release.
+        future use. If the search result is ambiguous, the selection policy
+        decides which release to use (by default the user is asked to select
+        the best-matching release).
         """
         params = _ReleaseParams(artist, title, disambiguation)
 
         release = self._cache.lookup(params)
-        if release is not None:
+        self._revalidate()
+        if release is not None or self._cache.is_negative(params.key()):
             return release
 
-        release = self._search_in_musicbrainz(artist, title)
+        if self._fuzzy_lookup(params, {'artist': artist, 'title': title}) is not None:
+            return self._cache.lookup(params)
+
+        release, not_found = self._search_in_musicbrainz(artist, title)
         if release is not None:
             self._cache.store(release, params)
+        elif not_found:
+            self._cache.store_negative(params.key())
 
         return release
 
+    def find_recording(self, artist: str, title: str, album: str) -> Optional[str]:
+        """
+        Find a recording MBID by artist, title and album in the tracklists of
+        cached releases, without searching MusicBrainz. The cache must be
+        opened with the track_index option, otherwise None is returned.
+        """
+        return self._cache.find_recording(_RecordingParams(artist, title, album))
+
     def get_mbid(self, mbid: str, disambiguation: Optional[str] = None) -> Optional[Dict]:
         """
         Retrieve a release from the cache using the specified release MBID. If
@@ -269,13 +618,40 @@ class MbReleaseCache(_MbCache):
         the release in the cache.
         """
         release = self._cache.lookup_id(mbid)
-        if release is not None:
+        self._revalidate()
+        if release is not None or self._cache.is_negative(mbid):
             return release
 
-        release = self._lookup_in_musicbrainz(mbid)
-        if release is not None:
-            params = _ReleaseParams(release['artist-credit-phrase'], release['title'],
-                                    disambiguation)
-            self._cache.store(release, params)
+        return self._store_lookup_result(mbid, self._lookup_in_musicbrainz(mbid), disambiguation)
 
-        return release
+    def get_many(self,
+                 mbids: Iterable[str],
+                 disambiguation: Optional[str] = None) -> List[Optional[Dict]]:
+        """
+        Retrieve many releases by their MBIDs. All cache hits are resolved
+        first, then each distinct missing release is looked up in MusicBrainz
+        once, as in get_mbid(). The lookups are run concurrently. Return the
+        releases (or None) in the order of the input MBIDs.
+        """
+        mbids = list(mbids)
+        found: Dict[str, Optional[Dict]] = {}
+        missing: List[str] = []
+
+        for mbid in mbids:
+            if mbid in found:
+                continue
+
+            found[mbid] = self._cache.lookup_id(mbid)
+            if found[mbid] is None and not self._cache.is_negative(mbid):
+                missing.append(mbid)
+
+        self._revalidate()
+
+        fetcher = self._get_fetcher()
+        lookups = [(mbid, fetcher.submit(('release', mbid), self._lookup_in_musicbrainz, mbid))
+                   for mbid in missing]
+
+        for mbid, lookup in lookups:
+            found[mbid] = self._store_lookup_result(mbid, lookup.result(), disambiguation)
+
+        return [found[mbid] for mbid in mbids]
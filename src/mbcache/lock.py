@@ -1,36 +1,59 @@
 """
 Provides a file-based locking mechanism for POSIX-compliant systems.
 
-The implementation ensures exclusive access across multiple OS processes with
-fcntl locking mechanism, allowing only one process at a time to hold the lock.
+The implementation controls access across multiple OS processes with fcntl
+locking mechanism. The lock can be held either exclusively by one process at
+a time, or shared by many processes which only read the protected data.
 Because of fcntl dependency, the implementation works only on POSIX-compliant
 operating systems.
 
-Note: this lock does not prevent concurrent access by multiple threads in the
-same process.
+The inter-process lock does not prevent concurrent access by multiple threads
+in the same process. Threads sharing a cache object are synchronized by
+a readers-writer lock instead, while the object holds one inter-process lock
+on behalf of all of them.
 """
 
 import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
 
 
 class _Lock:
-    """An exclusive, reentrant, inter-process lock."""
+    """A shared or exclusive, reentrant, inter-process lock."""
 
     def __init__(self, lock_path):
         self.lock_path = lock_path
         self.lock_file = None
+        self.exclusive = False
 
-    def acquire(self):
+    def acquire(self, shared=False):
         """
-        Acquire the lock for exclusive access across processes.
+        Acquire the lock for exclusive access across processes, or for shared
+        access if shared is True.
 
-        This method blocks if the lock is held by another process, but will
-        not block if the lock is already held by the same process. This means
-        the lock will not prevent concurrent access by multiple threads in the
-        same process.
+        This method blocks if the lock is held by another process in
+        a conflicting mode, but will not block if the lock is already held by
+        the same process. This means the lock will not prevent concurrent
+        access by multiple threads in the same process.
         """
         self.lock_file = open(self.lock_path, 'ab')  # pylint: disable=consider-using-with
-        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        fcntl.flock(self.lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        self.exclusive = not shared
+
+    def upgrade(self):
+        """
+        Convert a shared lock into an exclusive one.
+
+        The conversion is not atomic: another process may acquire the lock
+        exclusively before this method returns. Any data read while holding
+        the shared lock must therefore be read again after the upgrade.
+        """
+        assert self.lock_file is not None, 'lock is not held'
+
+        if not self.exclusive:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+            self.exclusive = True
 
     def release(self):
         """
@@ -46,3 +69,66 @@ class _Lock:
         fcntl.flock(self.lock_file, fcntl.LOCK_UN)
         self.lock_file.close()
         self.lock_file = None
+        self.exclusive = False
+
+
+class _RwLock:
+    """
+    A readers-writer lock for threads within one process.
+
+    Any number of threads can hold the lock for reading at the same time,
+    while a writer holds it alone. Waiting writers take precedence over new
+    readers, so that writers are not starved. The write lock is reentrant,
+    and the thread holding it can also take the read lock. A thread holding
+    only the read lock must not try to take the write lock.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writers_waiting = 0
+        self.writer: Optional[int] = None
+        self.depth = 0
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        """Hold the lock for reading for the duration of the with statement."""
+        if self.writer == threading.get_ident():
+            yield
+            return
+
+        with self.condition:
+            while self.writer is not None or self.writers_waiting > 0:
+                self.condition.wait()
+            self.readers += 1
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.readers -= 1
+                if self.readers == 0:
+                    self.condition.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        """Hold the lock for writing for the duration of the with statement."""
+        ident = threading.get_ident()
+
+        with self.condition:
+            if self.writer != ident:
+                self.writers_waiting += 1
+                while self.writer is not None or self.readers > 0:
+                    self.condition.wait()
+                self.writers_waiting -= 1
+                self.writer = ident
+            self.depth += 1
+
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.writer = None
+                    self.condition.notify_all()
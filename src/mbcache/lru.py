@@ -0,0 +1,86 @@
+"""A bounded in-memory cache with least-recently-used eviction."""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class _LruCache:
+    """
+    In-memory cache which keeps at most max_entries values whose total size
+    does not exceed max_bytes. Either limit can be None, meaning no limit.
+    If max_entries is 0 the cache stores nothing. When a limit is exceeded,
+    the least recently used values are discarded.
+
+    The size of each value is provided by the caller. Hits and misses are
+    counted for reporting purposes. All methods are thread-safe.
+    """
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.values: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the value stored under the key and mark it as recently used."""
+        with self.lock:
+            try:
+                value, _ = self.values[key]
+            except KeyError:
+                self.misses += 1
+                return None
+
+            self.values.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, size: int = 0) -> None:
+        """Store a value of the given size, discarding old values if needed."""
+        with self.lock:
+            self._discard(key)
+
+            if self.max_entries == 0 or (self.max_bytes is not None and size > self.max_bytes):
+                return
+
+            self.values[key] = (value, size)
+            self.size += size
+
+            while ((self.max_entries is not None and len(self.values) > self.max_entries)
+                   or (self.max_bytes is not None and self.size > self.max_bytes)):
+                _, (_, old_size) = self.values.popitem(last=False)
+                self.size -= old_size
+
+    def _discard(self, key: Hashable) -> None:
+        try:
+            _, size = self.values.pop(key)
+            self.size -= size
+        except KeyError:
+            pass
+
+    def invalidate(self, key: Hashable) -> None:
+        """Discard the value stored under the key, if any."""
+        with self.lock:
+            self._discard(key)
+
+    def clear(self) -> None:
+        """Discard all values. Counters are not reset."""
+        with self.lock:
+            self.values.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit and miss counters and the current cache occupancy."""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.values),
+                'bytes': self.size,
+            }
@@ -0,0 +1,129 @@
+"""
+Instrumentation of the caches.
+
+Metrics are either counters (lookup hits and misses, bytes read and written,
+and so on), or timers, which collect the durations of operations (index
+loading, release decoding, MusicBrainz requests) in histograms with buckets
+growing by powers of two. Hooks registered with add_hook() are called with
+the name and value of every counted or timed event, so that metrics can be
+forwarded to other monitoring systems.
+
+Counter names:
+
+- lookup.hit, lookup.miss: cache lookups (by key or by MBID)
+- lookup.track_index: recordings found in the tracklists of cached releases
+- lookup.fuzzy: cache misses resolved by selecting a similar cached entry
+- negative.hit, negative.store: failed searches and lookups found in and
+  stored to the negative cache
+- store: entries stored in the cache
+- release.lru_hit: releases returned from the in-memory LRU cache
+- bytes.read, bytes.written: release data read from and written to storage
+
+Timer names:
+
+- index.load, index.flush: loading and writing the cache index
+- release.read, release.decode: reading and parsing release data
+- network.search, network.lookup: MusicBrainz searches and MBID lookups
+- network.wait: waiting for the request rate limit before a search or lookup
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+_Hook = Callable[[str, float], None]
+
+# upper bounds of histogram buckets, in seconds: from 1 microsecond to about 8 seconds
+_BUCKETS = [1e-6 * 2**exponent for exponent in range(24)]
+
+
+class _Histogram:
+    """Count, total, extremes and bucket counts of observed durations."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.buckets = [0] * (len(_BUCKETS) + 1)
+
+    def observe(self, seconds: float) -> None:
+        """Add an observed duration to the histogram."""
+        self.count += 1
+        self.total += seconds
+        self.min = seconds if self.min is None else min(self.min, seconds)
+        self.max = seconds if self.max is None else max(self.max, seconds)
+
+        for position, bound in enumerate(_BUCKETS):
+            if seconds <= bound:
+                self.buckets[position] += 1
+                return
+
+        self.buckets[-1] += 1
+
+    def summary(self) -> Dict:
+        """Return the histogram as a JSON-serializable dictionary."""
+        buckets = {}
+        for bound, count in zip(_BUCKETS + [float('inf')], self.buckets):
+            if count > 0:
+                buckets['+Inf' if bound == float('inf') else f'{bound:.6g}'] = count
+
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count > 0 else None,
+            'min': self.min,
+            'max': self.max,
+            'buckets': buckets,
+        }
+
+
+class _Metrics:
+    """Thread-safe collection of counters and timers, with optional hooks."""
+
+    def __init__(self):
+        self.counters: Dict[str, int] = {}
+        self.timers: Dict[str, _Histogram] = {}
+        self.hooks: List[_Hook] = []
+        self.lock = threading.Lock()
+
+    def add_hook(self, hook: _Hook) -> None:
+        """Call hook(name, value) for every event counted or timed from now on."""
+        self.hooks.append(hook)
+
+    def count(self, name: str, value: int = 1) -> None:
+        """Increase the named counter by value."""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+        for hook in self.hooks:
+            hook(name, value)
+
+    def observe(self, name: str, seconds: float) -> None:
+        """Add a duration to the named timer."""
+        with self.lock:
+            self.timers.setdefault(name, _Histogram()).observe(seconds)
+
+        for hook in self.hooks:
+            hook(name, seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """Add the duration of the with statement to the named timer."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict:
+        """Return all counters and timers as a JSON-serializable dictionary."""
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'timers': {
+                    name: timer.summary()
+                    for name, timer in self.timers.items()
+                },
+            }
@@ -1,42 +1,70 @@
 """Entity parameters module."""
 
 from dataclasses import dataclass
+from functools import lru_cache
 from typing import Optional
 
 from mbnames import normalize
 
+# Normalized strings are memoized for parameters which are looked up repeatedly
+# through different objects (e.g. when the same albums are imported again).
+# Unique parameters rarely hit the memo. It is bounded to keep memory in check.
+_normalize = lru_cache(maxsize=65536)(normalize)
 
-@dataclass
+
+@dataclass(frozen=True)
 class _EntityParams:
-    """Abstract base class for entity parameters."""
+    """
+    Abstract base class for entity parameters.
+
+    Parameters are immutable, so the cache key is computed only once, when it
+    is first needed, and kept in the object.
+    """
+    __slots__ = ('_key', )
 
     def key(self) -> str:
         """Represent entity parameters as a cache key."""
+        # the slot is not a dataclass field, so it is not known to type checkers
+        key: Optional[str] = getattr(self, '_key', None)
+        if key is None:
+            key = self._make_key()
+            object.__setattr__(self, '_key', key)
+        return key
+
+    def _make_key(self) -> str:
         raise NotImplementedError
 
+    def __setstate__(self, state) -> None:
+        # copy and pickle would restore slots with setattr(), which frozen objects reject
+        _, slots = state
+        for name, value in slots.items():
+            object.__setattr__(self, name, value)
+
 
-@dataclass
+@dataclass(frozen=True)
 class _RecordingParams(_EntityParams):
     """Recording parameters."""
+    __slots__ = ('artist', 'title', 'album')
+
     artist: str
     title: str
     album: str
 
-    def key(self) -> str:
-        """Represent recording parameters as a cache key."""
-        return normalize('\t'.join((self.artist, self.album, self.title)))
+    def _make_key(self) -> str:
+        return _normalize('\t'.join((self.artist, self.album, self.title)))
 
 
-@dataclass
+@dataclass(frozen=True)
 class _ReleaseParams(_EntityParams):
     """Release parameters."""
+    __slots__ = ('artist', 'title', 'disambiguation')
+
     artist: str
     title: str
     disambiguation: Optional[str]
 
-    def key(self) -> str:
-        """Represent release parameters as a cache key."""
+    def _make_key(self) -> str:
         if self.disambiguation is None:
-            return normalize('\t'.join((self.artist, self.title)))
+            return _normalize('\t'.join((self.artist, self.title)))
 
-        return normalize('\t'.join((self.artist, self.title, self.disambiguation)))
+        return _normalize('\t'.join((self.artist, self.title, self.disambiguation)))
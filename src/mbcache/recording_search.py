@@ -14,6 +14,16 @@ def _parse_args():
     parser.add_argument('title', help='recording title')
     parser.add_argument('album', help='album title')
 
+    parser.add_argument('-b',
+                        '--backend',
+                        default=None,
+                        help='index backend of the cache (default: as recorded in the cache)')
+
+    parser.add_argument('-r',
+                        '--read-only',
+                        action='store_true',
+                        help='lock the cache exclusively only if something is stored in it')
+
     parser.add_argument('-v', '--version', action='version', version=VERSION)
 
     return parser.parse_args()
@@ -21,7 +31,7 @@ def _parse_args():
 
 def main():
     args = _parse_args()
-    cache = MbRecordingCache()
+    cache = MbRecordingCache(backend=args.backend, read_only=args.read_only)
     mbid = cache.get(args.artist, args.title, args.album)
 
     if mbid is not None:
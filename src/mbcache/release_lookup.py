@@ -17,6 +17,16 @@ def _parse_args():
                         default=None,
                         help='disambiguation string (only used for storing)')
 
+    parser.add_argument('-b',
+                        '--backend',
+                        default=None,
+                        help='index backend of the cache (default: as recorded in the cache)')
+
+    parser.add_argument('-r',
+                        '--read-only',
+                        action='store_true',
+                        help='lock the cache exclusively only if something is stored in it')
+
     parser.add_argument('-v', '--version', action='version', version=VERSION)
 
     return parser.parse_args()
@@ -24,7 +34,7 @@ def _parse_args():
 
 def main():
     args = _parse_args()
-    cache = MbReleaseCache()
+    cache = MbReleaseCache(backend=args.backend, read_only=args.read_only)
     release = cache.get_mbid(args.mbid, args.disambiguation)
 
     if release is not None:
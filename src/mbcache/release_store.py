@@ -0,0 +1,462 @@
+"""
+Storage engines for release data.
+
+Release data is stored as one JSON document per release, named after the
+release MBID. Documents can be stored as plain, indented JSON (the original
+format), or as compact JSON compressed with one of the standard library
+compression modules. Documents stored in any format can always be read, so
+the format can be changed without converting existing files first.
+
+There are two storage engines: one keeps each document in a separate file,
+the other appends documents to large pack files and reads them through
+memory maps. The storage engine of a cache is recorded in its directory
+(see `_resolve_storage()`).
+"""
+
+import fnmatch
+import glob
+import gzip
+import json
+import lzma
+import mmap
+import os
+import threading
+import zlib
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from mbcache.index import _Index, _open_index
+
+_MBID_GLOB = '????????-????-????-????-????????????'
+
+
+def _identity(data: bytes) -> bytes:
+    return data
+
+
+# compression name: (file name suffix, compress function, decompress function)
+_FORMATS: Dict[Optional[str], Tuple[str, Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    None: ('.json', _identity, _identity),
+    'gzip': ('.json.gz', gzip.compress, gzip.decompress),
+    'lzma': ('.json.xz', lzma.compress, lzma.decompress),
+    'zlib': ('.json.zz', zlib.compress, zlib.decompress),
+}
+
+
+class _ReleaseStore:
+    """Base class for release data storage engines."""
+
+    def read(self, mbid: str) -> Optional[bytes]:
+        """Return the JSON document of the release, or None if it is not stored."""
+        raise NotImplementedError
+
+    def write(self, mbid: str, release_data: Dict) -> int:
+        """
+        Store the release data, replacing any previously stored document.
+        Return the number of bytes written.
+        """
+        raise NotImplementedError
+
+    def remove(self, mbid: str) -> None:
+        """Remove the release data, if it is stored."""
+        raise NotImplementedError
+
+    def mbids(self) -> Set[str]:
+        """Return MBIDs of all stored releases."""
+        raise NotImplementedError
+
+    def size(self, mbid: str) -> int:
+        """Return the number of bytes used to store the release, or 0."""
+        raise NotImplementedError
+
+    def convert(self, mbid: str) -> bool:
+        """
+        Rewrite a stored release in the current storage format. Return True
+        if the release was rewritten.
+        """
+        raise NotImplementedError
+
+    def migrate_layout(self) -> int:
+        """
+        Move stored releases to the current layout, if this can be done
+        cheaply. Return the number of moved releases.
+        """
+        return 0
+
+    def reload(self) -> None:
+        """Discard any state which may have been changed by other processes."""
+
+    def flush(self) -> None:
+        """Write pending changes to disk."""
+
+    def close(self) -> None:
+        """Write pending changes to disk and release resources."""
+
+
+class _FileReleaseStore(_ReleaseStore):
+    """
+    Release storage engine which keeps each release in a separate file.
+
+    New files are written in the format selected by compression: None for
+    indented JSON, or 'gzip', 'lzma' or 'zlib' for compressed compact JSON.
+
+    With the 'flat' layout all files are kept in the cache directory. With
+    the 'sharded' layout they are kept in two levels of subdirectories named
+    after the first four hex digits of the MBID (e.g. 'ab/cd/abcd....json'),
+    which keeps directories small in large caches. Files are found in either
+    layout, and migrate_layout() moves files to the current one.
+    """
+
+    def __init__(self, cache_dir: str, compression: Optional[str] = None, layout: str = 'flat'):
+        if compression not in _FORMATS:
+            raise ValueError(f'unsupported compression: {compression}')
+
+        if layout not in ('flat', 'sharded'):
+            raise ValueError(f'unsupported layout: {layout}')
+
+        self.cache_dir = cache_dir
+        self.compression = compression
+        self.sharded = layout == 'sharded'
+
+        # (compression, sharded) variants, in the order in which they are tried
+        current = (compression, self.sharded)
+        self.variants = [current] + [(c, sharded) for sharded in (self.sharded, not self.sharded)
+                                     for c in _FORMATS if (c, sharded) != current]
+
+    def _path(self, mbid: str, compression: Optional[str], sharded: bool) -> str:
+        if sharded:
+            return os.path.join(self.cache_dir, mbid[0:2], mbid[2:4],
+                                mbid + _FORMATS[compression][0])
+
+        return os.path.join(self.cache_dir, mbid + _FORMATS[compression][0])
+
+    def _find(self, mbid: str) -> Optional[Tuple[str, Optional[str], bool]]:
+        # the current format and layout are tried first, as the most likely ones
+        for compression, sharded in self.variants:
+            path = self._path(mbid, compression, sharded)
+            if os.path.exists(path):
+                return path, compression, sharded
+
+        return None
+
+    def read(self, mbid: str) -> Optional[bytes]:
+        found = self._find(mbid)
+        if found is None:
+            return None
+
+        path, compression, _ = found
+        try:
+            with open(path, 'rb') as rel:
+                return _FORMATS[compression][2](rel.read())
+        except FileNotFoundError:
+            return None
+
+    def write(self, mbid: str, release_data: Dict) -> int:
+        compress = _FORMATS[self.compression][1]
+
+        if self.compression is None:
+            document = json.dumps(release_data, indent=1)
+        else:
+            document = json.dumps(release_data, separators=(',', ':'))
+
+        path = self._path(mbid, self.compression, self.sharded)
+        if self.sharded:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, 'wb') as rel:
+            written = rel.write(compress(document.encode('utf-8')))
+
+        self._remove_variants(mbid, self.variants[1:])
+        return written
+
+    def _remove_variants(self, mbid: str, variants: List[Tuple[Optional[str], bool]]) -> None:
+        for compression, sharded in variants:
+            try:
+                os.remove(self._path(mbid, compression, sharded))
+            except FileNotFoundError:
+                pass
+
+    def remove(self, mbid: str) -> None:
+        self._remove_variants(mbid, self.variants)
+
+    def mbids(self) -> Set[str]:
+        found = set()
+
+        for suffix, _, _ in _FORMATS.values():
+            for pattern in (_MBID_GLOB + suffix, os.path.join('??', '??', _MBID_GLOB + suffix)):
+                for path in glob.glob(os.path.join(self.cache_dir, pattern)):
+                    found.add(os.path.basename(path)[:-len(suffix)])
+
+        return found
+
+    def size(self, mbid: str) -> int:
+        found = self._find(mbid)
+        if found is None:
+            return 0
+
+        try:
+            return os.path.getsize(found[0])
+        except FileNotFoundError:
+            return 0
+
+    def convert(self, mbid: str) -> bool:
+        found = self._find(mbid)
+        if found is None or found[1:] == self.variants[0]:
+            return False
+
+        path, compression, _ = found
+        if compression == self.compression:
+            self._move(mbid, path, compression)
+            return True
+
+        document = self.read(mbid)
+        assert document is not None, 'release disappeared during conversion'
+        self.write(mbid, json.loads(document))
+        return True
+
+    def _move(self, mbid: str, path: str, compression: Optional[str]) -> None:
+        target = self._path(mbid, compression, self.sharded)
+        if self.sharded:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+
+    def migrate_layout(self) -> int:
+        """
+        Move files stored in the flat layout to the sharded layout, if it is
+        the current one. Return the number of moved files.
+        """
+        if not self.sharded:
+            return 0
+
+        suffixes = {suffix: compression for compression, (suffix, _, _) in _FORMATS.items()}
+        moved = 0
+
+        with os.scandir(self.cache_dir) as entries:
+            for entry in entries:
+                mbid, dot, suffix = entry.name.partition('.')
+                compression = suffixes.get(dot + suffix, 'unknown')
+                if (compression != 'unknown' and fnmatch.fnmatch(mbid, _MBID_GLOB)
+                        and entry.is_file()):
+                    self._move(mbid, entry.path, compression)
+                    moved += 1
+
+        return moved
+
+
+class _PackReleaseStore(_ReleaseStore):
+    """
+    Release storage engine which appends documents to pack files.
+
+    Documents are stored as compact JSON (compressed as selected by
+    compression) in pack files in the 'packs' subdirectory. A pack index,
+    stored with the given index backend, maps release MBIDs to the pack
+    number, offset and length of their documents. Pack files are read through
+    memory maps, so a lookup does not open or stat any file.
+
+    Replaced and removed documents are left in place as dead space, which is
+    reclaimed by repack(). Releases stored as separate files (by the file
+    storage engine) can still be read, and convert() moves them into packs.
+    """
+
+    max_pack_size = 256 * 1024 * 1024
+
+    def __init__(self,
+                 cache_dir: str,
+                 compression: Optional[str] = None,
+                 backend: str = 'json',
+                 read_only: bool = False):
+        self.files = _FileReleaseStore(cache_dir, compression)
+        self.compression = compression
+        self.backend = backend
+        self.pack_dir = os.path.join(cache_dir, 'packs')
+        self.maps: Dict[int, mmap.mmap] = {}
+        self.maps_lock = threading.Lock()
+        os.makedirs(self.pack_dir, exist_ok=True)
+        self.index: _Index = _open_index(backend, self.pack_dir, 'packs', read_only)
+
+    def _pack_path(self, pack: int) -> str:
+        return os.path.join(self.pack_dir, f'pack-{pack:05d}.dat')
+
+    def _packs(self) -> List[int]:
+        names = glob.glob(os.path.join(self.pack_dir, 'pack-?????.dat'))
+        return sorted(int(os.path.basename(name)[5:10]) for name in names)
+
+    def _map(self, pack: int, end: int) -> mmap.mmap:
+        mapped = self.maps.get(pack)
+
+        # pack files grow, so the map may not cover recently appended data
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            with open(self._pack_path(pack), 'rb') as pack_file:
+                mapped = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[pack] = mapped
+
+        return mapped
+
+    def _unmap(self) -> None:
+        for mapped in self.maps.values():
+            mapped.close()
+        self.maps = {}
+
+    def _read_packed(self, location: Dict) -> bytes:
+        end = location['offset'] + location['length']
+        # a map may be replaced by a concurrent reader, so it is sliced under the lock
+        with self.maps_lock:
+            document = self._map(location['pack'], end)[location['offset']:end]
+        return _FORMATS[location['compression']][2](document)
+
+    def read(self, mbid: str) -> Optional[bytes]:
+        location = self.index.get(mbid)
+        if location is None:
+            return self.files.read(mbid)
+
+        return self._read_packed(location)
+
+    def _append(self, mbid: str, document: bytes, compression: Optional[str]) -> None:
+        packs = self._packs()
+        pack = packs[-1] if packs else 0
+
+        path = self._pack_path(pack)
+        if os.path.exists(path) and os.path.getsize(path) + len(document) > self.max_pack_size:
+            pack += 1
+            path = self._pack_path(pack)
+
+        with open(path, 'ab') as pack_file:
+            offset = pack_file.tell()
+            pack_file.write(document)
+
+        location = {
+            'id': mbid,
+            'pack': pack,
+            'offset': offset,
+            'length': len(document),
+            'compression': compression,
+        }
+        self.index.put(mbid, location)
+
+    def write(self, mbid: str, release_data: Dict) -> int:
+        document = json.dumps(release_data, separators=(',', ':')).encode('utf-8')
+        document = _FORMATS[self.compression][1](document)
+        self._append(mbid, document, self.compression)
+        self.files.remove(mbid)
+        return len(document)
+
+    def remove(self, mbid: str) -> None:
+        self.index.delete(mbid)
+        self.files.remove(mbid)
+
+    def mbids(self) -> Set[str]:
+        return self.index.ids() | self.files.mbids()
+
+    def size(self, mbid: str) -> int:
+        location = self.index.get(mbid)
+        if location is None:
+            return self.files.size(mbid)
+
+        return location['length']
+
+    def convert(self, mbid: str) -> bool:
+        if mbid in self.index:
+            return False
+
+        document = self.files.read(mbid)
+        if document is None:
+            return False
+
+        self.write(mbid, json.loads(document))
+        return True
+
+    def dead_bytes(self) -> int:
+        """Return the number of bytes in pack files used by replaced documents."""
+        total = sum(os.path.getsize(self._pack_path(pack)) for pack in self._packs())
+        return total - sum(location['length'] for _, location in self.index.items())
+
+    def repack(self) -> int:
+        """
+        Copy all live documents to new pack files and remove the old ones.
+        Return the number of reclaimed bytes.
+        """
+        dead = self.dead_bytes()
+        old_packs = self._packs()
+        if not old_packs:
+            return 0
+
+        live = sorted(self.index.items(), key=lambda item: (item[1]['pack'], item[1]['offset']))
+        pack = old_packs[-1] + 1
+        pack_file = open(self._pack_path(pack), 'wb')  # pylint: disable=consider-using-with
+
+        for mbid, location in live:
+            start = location['offset']
+            end = start + location['length']
+            document = self._map(location['pack'], end)[start:end]
+
+            if pack_file.tell() + len(document) > self.max_pack_size and pack_file.tell() > 0:
+                pack_file.close()
+                pack += 1
+                pack_file = open(self._pack_path(pack), 'wb')  # pylint: disable=consider-using-with
+
+            location.update(pack=pack, offset=pack_file.tell())
+            pack_file.write(document)
+            self.index.put(mbid, location)
+
+        pack_file.close()
+
+        # old packs may be removed only when the index no longer refers to them
+        self.index.flush()
+        self._unmap()
+        for old_pack in old_packs:
+            os.remove(self._pack_path(old_pack))
+
+        return dead
+
+    def reload(self) -> None:
+        self._unmap()
+        self.index.close()
+        self.index = _open_index(self.backend, self.pack_dir, 'packs')
+
+    def flush(self) -> None:
+        self.index.flush()
+
+    def close(self) -> None:
+        self._unmap()
+        self.index.close()
+
+
+# storage engines which can read (and convert) the releases of other engines
+_MIGRATIONS = {'pack': {'files'}}
+
+
+def _resolve_storage(cache_dir: str, storage: Optional[str], read_only: bool = False) -> str:
+    """
+    Return the storage engine of the release cache in the directory. If
+    storage is None, the recorded engine of the cache is used (or 'pack' if
+    the cache has pack files, or 'files' otherwise). A different engine is
+    accepted only if it can read the releases of the cache and the cache is
+    not read-only. Otherwise ValueError is raised. Unless the cache is
+    read-only, the engine is recorded in the directory.
+    """
+    marker_path = os.path.join(cache_dir, 'release.storage')
+    try:
+        with open(marker_path, encoding='utf-8') as marker:
+            recorded: Optional[str] = marker.read().strip()
+    except FileNotFoundError:
+        recorded = 'pack' if os.path.isdir(os.path.join(cache_dir, 'packs')) else None
+
+    if storage is None:
+        storage = recorded or 'files'
+
+    if storage not in ('files', 'pack'):
+        raise ValueError(f'unknown release storage: {storage}')
+
+    if recorded is not None and storage != recorded:
+        if read_only or recorded not in _MIGRATIONS.get(storage, set()):
+            raise ValueError(f'cache in {cache_dir} uses the {recorded} release storage, '
+                             f'which cannot be opened as {storage}')
+
+    if not read_only and (recorded != storage or not os.path.exists(marker_path)):
+        temp_path = marker_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as marker:
+            marker.write(storage + '\n')
+        os.replace(temp_path, marker_path)
+
+    return storage
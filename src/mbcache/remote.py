@@ -0,0 +1,132 @@
+"""
+Access to caches owned by a cache daemon (see mbcache.daemon).
+
+The daemon and its clients exchange JSON objects over a Unix domain socket,
+one object per line. A request names the cache, the method and its
+arguments (positional, and optionally keyword arguments in "kwargs"). Entity
+parameters are sent as a list of their fields, and converted to parameter
+objects of the right type by the daemon, which passes them as the last
+positional argument:
+
+    {"cache": "recordings", "method": "lookup", "args": [], "params": ["a", "t", "b"]}
+
+The response holds either the result of the method, or an error message:
+
+    {"result": "5b11f4ce-a62d-471e-81fc-a69a8278c7da"}
+    {"error": "unknown cache: foo"}
+"""
+
+import dataclasses
+import json
+import os
+import socket
+import threading
+from typing import Any, Dict, List, Optional
+
+from xdg import BaseDirectory
+
+from mbcache.params import _EntityParams
+from mbcache.version import APPNAME
+
+
+def _default_socket_path() -> str:
+    """Return the path of the cache daemon socket used when none is given."""
+    return os.path.join(BaseDirectory.save_cache_path(APPNAME), 'daemon.sock')
+
+
+def _encode(message: Dict) -> bytes:
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+class _RemoteCache:
+    """
+    Client-side stand-in for a low-level cache owned by a cache daemon.
+
+    Supports the lookup and store methods used by the high-level caches.
+    Each call is one round-trip over the daemon socket. A single connection
+    is shared by all threads, one request at a time.
+    """
+
+    def __init__(self, socket_path: str, cache_name: str):
+        self.cache_name = cache_name
+        self.lock = threading.Lock()
+        self.sock: Optional[socket.socket] = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.stream = self.sock.makefile('rb')
+
+    def __del__(self):
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection to the daemon. The daemon keeps the cache open."""
+        if self.sock is not None:
+            self.stream.close()
+            self.sock.close()
+            self.sock = None
+
+    def _call(self, method: str, *args, params: Optional[_EntityParams] = None, **kwargs) -> Any:
+        request: Dict[str, Any] = {'cache': self.cache_name, 'method': method, 'args': args}
+        if kwargs:
+            request['kwargs'] = kwargs
+        if params is not None:
+            request['params'] = [
+                getattr(params, field.name) for field in dataclasses.fields(params)
+            ]
+
+        with self.lock:
+            assert self.sock is not None, 'connection is closed'
+            self.sock.sendall(_encode(request))
+            line = self.stream.readline()
+
+        if not line:
+            raise ConnectionError('cache daemon closed the connection')
+
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError(f'cache daemon error: {response["error"]}')
+
+        return response['result']
+
+    def lookup(self, params: _EntityParams) -> Any:
+        """Retrieve entity data from the cache."""
+        return self._call('lookup', params=params)
+
+    def lookup_id(self, mbid: str) -> Optional[Dict]:
+        """Look up release information by MBID."""
+        return self._call('lookup_id', mbid)
+
+    def find_recording(self, params: _EntityParams) -> Optional[str]:
+        """Look up a recording MBID in the tracklists of cached releases."""
+        return self._call('find_recording', params=params)
+
+    def similar(self, params: _EntityParams, min_score: float = 0.8, limit: int = 5) -> List:
+        """Find cached entries whose keys are similar to the key of the entity parameters."""
+        return self._call('similar', params=params, min_score=min_score, limit=limit)
+
+    def alias(self, params: _EntityParams, key: str) -> None:
+        """Store the MBID stored under the key also under the key of the entity parameters."""
+        self._call('alias', params=params, key=key)
+
+    def store(self, data: Any, params: _EntityParams) -> None:
+        """Store entity data in the cache."""
+        self._call('store', data, params=params)
+
+    def exists(self, params: _EntityParams) -> bool:
+        """Check if specified entry exists in the cache."""
+        return self._call('exists', params=params)
+
+    def is_negative(self, key: str) -> bool:
+        """Check if a search or lookup identified by the key has recently failed."""
+        return self._call('is_negative', key)
+
+    def store_negative(self, key: str) -> None:
+        """Record that a search or lookup identified by the key has failed."""
+        self._call('store_negative', key)
+
+    def take_stale(self) -> Dict[str, str]:
+        """Stale entries are not reported by the daemon."""
+        return {}
+
+    def refresh(self, key: str, release_data: Dict) -> None:
+        """Replace release data stored under the key with newly fetched data."""
+        self._call('refresh', key, release_data)
@@ -0,0 +1,129 @@
+"""
+Policies for selecting one of the results of a MusicBrainz search.
+
+When a search returns more than one result, the high-level caches ask their
+selection policy which result to use. The default policy asks the user. Other
+policies make the decision automatically, which makes it possible to use the
+caches in unattended batch jobs. A policy can also leave the decision for
+later (see DEFERRED), in which case nothing is recorded in the cache, so that
+the search is repeated the next time.
+"""
+
+import json
+import time
+from typing import Dict, List, Optional
+
+# returned by SelectionPolicy.select() when the decision is left for later
+DEFERRED = -1
+
+
+class SelectionPolicy:
+    """Base class for search result selection policies."""
+
+    def select(self, results: List[Dict], query: Dict[str, Optional[str]]) -> Optional[int]:
+        """
+        Return the index of the selected search result, None if none of the
+        results should be used (which is recorded in the cache as a negative
+        entry), or DEFERRED if the decision is left for later. The query holds
+        the search parameters.
+        """
+        raise NotImplementedError
+
+    def confirming(self) -> 'SelectionPolicy':
+        """
+        Return a policy which selects as this one does, except that it asks
+        the user about a single result instead of selecting it right away.
+        Used for selections which are hard to undo, such as approximate
+        matches of cached entries.
+        """
+        return self
+
+
+class InteractiveSelection(SelectionPolicy):
+    """
+    Ask the user to select one of the search results. A single result is
+    selected without asking, unless ask_single is True.
+    """
+
+    def __init__(self, ask_single: bool = False):
+        self.ask_single = ask_single
+
+    def confirming(self) -> SelectionPolicy:
+        return InteractiveSelection(ask_single=True)
+
+    def select(self, results: List[Dict], query: Dict[str, Optional[str]]) -> Optional[int]:
+        count = len(results)
+
+        if count == 1 and not self.ask_single:
+            return 0
+
+        while True:
+            index = int(input(f'Which one to use? (0 - none of these) [0-{count}] '))
+
+            if index == 0:
+                print('Search result discarded.')
+                return None
+
+            if 1 <= index <= count:
+                return index - 1
+
+
+class ScoreSelection(SelectionPolicy):
+    """
+    Select the best search result automatically if its score is at least
+    threshold and exceeds the score of the runner-up by at least margin.
+    Otherwise the decision is passed to the fallback policy, or deferred if
+    there is no fallback.
+    """
+
+    def __init__(self,
+                 threshold: int = 90,
+                 margin: int = 10,
+                 fallback: Optional[SelectionPolicy] = None):
+        self.threshold = threshold
+        self.margin = margin
+        self.fallback = fallback
+
+    def confirming(self) -> SelectionPolicy:
+        fallback = None if self.fallback is None else self.fallback.confirming()
+        return ScoreSelection(self.threshold, self.margin, fallback)
+
+    def select(self, results: List[Dict], query: Dict[str, Optional[str]]) -> Optional[int]:
+        scores = [int(result.get('ext:score', 0)) for result in results]
+        ranking = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        best = ranking[0]
+        runner_up = scores[ranking[1]] if len(ranking) > 1 else 0
+
+        if scores[best] >= self.threshold and scores[best] - runner_up >= self.margin:
+            return best
+
+        if self.fallback is not None:
+            return self.fallback.select(results, query)
+
+        return DEFERRED
+
+
+class DeferredSelection(SelectionPolicy):
+    """
+    Do not select any result, but append the query and the results to a
+    review queue file (in JSON lines format), so that they can be resolved
+    later. Usually used as the fallback of ScoreSelection.
+    """
+
+    def __init__(self, queue_path: str):
+        self.queue_path = queue_path
+
+    def select(self, results: List[Dict], query: Dict[str, Optional[str]]) -> Optional[int]:
+        summaries = [{
+            'id': result['id'],
+            'score': result.get('ext:score'),
+            'title': result.get('title'),
+            'artist': result.get('artist-credit-phrase'),
+        } for result in results]
+        record = {'time': int(time.time()), 'query': query, 'results': summaries}
+
+        with open(self.queue_path, 'a', encoding='utf-8') as queue:
+            queue.write(json.dumps(record) + '\n')
+
+        print(f'Deferred selection of {len(results)} results to {self.queue_path}.')
+        return DEFERRED
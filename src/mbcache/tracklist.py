@@ -0,0 +1,43 @@
+"""Recordings of a release, as stored in the recordings cache."""
+
+from typing import Dict, List, Optional, Tuple
+
+from mbnames import remove_featured
+
+from mbcache.params import _RecordingParams
+
+
+def _make_tracklist(release: Dict,
+                    feat_string: Optional[str] = None) -> List[Tuple[str, _RecordingParams]]:
+    tracklist = []
+    album = release['title']
+
+    for medium in release['medium-list']:
+        tracks = medium['track-list']
+        if 'pregap' in medium:
+            # include pregap track if it exists in the medium.
+            tracks = [medium['pregap']] + medium['track-list']
+
+        for track in tracks:
+            # skip video tracks
+            if track['recording'].get('video', False):
+                continue
+
+            # prefer track title over recording title
+            try:
+                title = track['title']
+            except KeyError:
+                title = track['recording']['title']
+
+            artist = track['artist-credit-phrase']
+            if len(track['artist-credit']) == 1:
+                # use canonical names on non-compound artists by default
+                artist = track['artist-credit'][0]['artist']['name']
+
+            artist = remove_featured(artist, feat_string)
+
+            mbid = track['recording']['id']
+            params = _RecordingParams(artist, title, album)
+            tracklist.append((mbid, params))
+
+    return tracklist